@@ -0,0 +1,382 @@
+"""效能量測腳本：python bench.py [parse|region|items|memory|persist|codec|startup|artists|canonical ...] [--repeat N]   (輸出可導向 bench_output.txt)"""
+import sys
+import time
+import statistics
+import tracemalloc
+import re
+import datetime
+import json
+import gc
+import random
+import os
+import tempfile
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+from rich.console import Console
+from rich.table import Table
+
+from models import Song, songs_from_json
+from matcher import ArtistMatcher
+from storage import CODECS, JsonPool, LazyJsonPool, SqliteStorage, save_json
+from parsers import PARSERS, LISTING_SELECTOR, SoupParser, HAS_LXML, listing_region
+
+if HAS_LXML: import lxml.html
+
+console = Console()
+
+BASE_URL = "https://www.ufret.jp/new.php"
+LISTING_PAGES = ["page.html", "page_full.html", "page_mobile.html"]
+SONG_PAGES = ["song_44469.html"]
+
+
+def read(fn):
+    with open(fn, "r", encoding="utf-8") as f: return f.read()
+
+
+def timeit(fn, repeat):
+    """回傳 (中位數 ms, 最後一次結果)"""
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times), result
+
+
+def bench_parse(repeat):
+    """各 backend 對 sample HTML 的解析時間，並確認輸出完全一致"""
+    table = Table(title=f"Parse time per page (median of {repeat}, ms)")
+    table.add_column("page")
+    table.add_column("kind")
+    for name in PARSERS: table.add_column(name, justify="right")
+    table.add_column("identical")
+
+    jobs = [(fn, "listing") for fn in LISTING_PAGES] + [(fn, "song") for fn in SONG_PAGES]
+    for fn, kind in jobs:
+        html = read(fn)
+        cells, outputs = [], []
+        for cls in PARSERS.values():
+            p = cls()
+            run = (lambda: p.listing(html, BASE_URL, 100)) if kind == "listing" else (lambda: p.song_page(html))
+            ms, out = timeit(run, repeat)
+            cells.append(f"{ms:.1f}")
+            outputs.append(out)
+        table.add_row(fn, kind, *cells, "yes" if all(o == outputs[0] for o in outputs) else "[red]NO[/red]")
+    console.print(table)
+
+
+def peak_kb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_region(repeat):
+    """整頁解析 vs 只解析 div.list-group / <h1> 區塊：時間與 peak memory
+
+    peak 由 tracemalloc 量測，只涵蓋 Python 物件；lxml 的 tree 配置在 libxml2 內不會被計入。
+    """
+    table = Table(title=f"Full document vs region-scoped parse (median of {repeat})")
+    for col in ("page", "backend", "full ms", "region ms", "speedup", "full peak KB", "region peak KB"):
+        table.add_column(col, justify="left" if col in ("page", "backend") else "right")
+
+    jobs = [(fn, "listing") for fn in LISTING_PAGES] + [(fn, "song") for fn in SONG_PAGES]
+    for fn, kind in jobs:
+        html = read(fn)
+        for name, cls in PARSERS.items():
+            p = cls()
+            if kind == "listing":
+                full, scoped = (lambda: p.listing(html, BASE_URL, 100, scoped=False)), (lambda: p.listing(html, BASE_URL, 100))
+            else:
+                full, scoped = (lambda: p.song_page(html, scoped=False)), (lambda: p.song_page(html))
+            full_ms, _ = timeit(full, repeat)
+            region_ms, _ = timeit(scoped, repeat)
+            table.add_row(fn, name, f"{full_ms:.1f}", f"{region_ms:.1f}", f"{full_ms / region_ms:.1f}x",
+                          f"{peak_kb(full):.0f}", f"{peak_kb(scoped):.0f}")
+    console.print(table)
+
+
+def legacy_parse_song_item(item, base_url):
+    """v19.5.8 的 UfretCrawler.parse_song_item 原樣保留，作為 items 基準與輸出比對對象"""
+    try:
+        link_tag = item if item.name == "a" else item.find("a")
+        if not link_tag: return None
+        href = link_tag.get("href", "")
+        if "song.php?data=" not in href: return None
+        url = urljoin(base_url, href)
+        badges = [t.text.strip() for t in item.select("span.badge")]
+        artist_tag = item.find("span", style=lambda s: s and ("font-size:12px" in s or "font-size: 12px" in s))
+        full_text = link_tag.get_text("|||", strip=True)
+        if artist_tag:
+            artist = artist_tag.get_text().strip()
+            if artist.startswith("-"): artist = artist[1:].strip()
+        else:
+            clean_raw = link_tag.get_text().strip()
+            if " - " in clean_raw:
+                artist = clean_raw.split(" - ")[-1].strip()
+            else:
+                artist = "Unknown"
+        strong_tag = link_tag.find("strong")
+        if strong_tag:
+            raw_title = strong_tag.get_text().strip()
+        else:
+            parts = [p.strip() for p in full_text.split("|||") if p.strip()]
+            clean_parts = [p for p in parts if p!=artist and p not in badges and "追加" not in p and "NEW" not in p and p!="U-リク" and p!="-"]
+            raw_title = clean_parts[0] if clean_parts else "Unknown"
+        if " - " in raw_title: raw_title = raw_title.split(" - ")[0].strip()
+        clean_pattern = r"(U-リク|NEW|追加|初心者|動画プラス|ピアノソロ|ソロ|初級|\d{4}/\d{2}/\d{2})"
+        title = re.sub(clean_pattern, "", raw_title).strip().lstrip("-").strip()
+        if not title: title = "Unknown Song"
+        is_piano = any("ピアノ" in t for t in badges)
+        is_video = any("動画" in t for t in badges)
+        return {
+            "title": title, "artist": artist, "url": url, "tags": badges,
+            "is_piano": is_piano, "is_video": is_video,
+            "is_piano_solo": False,
+            "discovered_at": datetime.datetime.now().strftime("%Y-%m-%d")
+        }
+    except: return None
+
+
+ITEMS_PER_PAGE = 24
+
+
+def bench_items(repeat):
+    """parse_song_item 熱路徑 micro-benchmark：每頁前 24 個項目重複解析 (repeat × 400 輪)"""
+    rounds = repeat * 400
+    table = Table(title=f"Item parser, {ITEMS_PER_PAGE} items × {rounds} rounds (µs per item)")
+    table.add_column("page")
+    table.add_column("legacy bs4", justify="right")
+    for name in PARSERS: table.add_column(name, justify="right")
+    table.add_column("identical")
+
+    for fn in LISTING_PAGES:
+        region = listing_region(read(fn), ITEMS_PER_PAGE)[0]
+        soup_items = BeautifulSoup(region, "html.parser").select(LISTING_SELECTOR)[:ITEMS_PER_PAGE]
+        expected = [legacy_parse_song_item(i, BASE_URL) for i in soup_items]
+        runs = [(lambda: [legacy_parse_song_item(i, BASE_URL) for i in soup_items])]
+        d = datetime.date.today().isoformat()
+        same = True
+        for cls in PARSERS.values():
+            p = cls()
+            if cls is SoupParser:
+                items = soup_items
+            else:
+                root = lxml.html.fragment_fromstring(region, create_parent="div")
+                items = p.ITEMS_XPATH(root)[:ITEMS_PER_PAGE]
+            same = same and [s and s.to_dict() for s in (p.parse_item(i, BASE_URL, d) for i in items)] == expected
+            runs.append(lambda p=p, items=items: [p.parse_item(i, BASE_URL, d) for i in items])
+        cells = []
+        for run in runs:
+            t0 = time.perf_counter()
+            for _ in range(rounds): run()
+            cells.append(f"{(time.perf_counter() - t0) / rounds / ITEMS_PER_PAGE * 1e6:.1f}")
+        table.add_row(fn, *cells, "yes" if same else "[red]NO[/red]")
+    console.print(table)
+
+
+def synthetic_db_perm(n, seed=19):
+    """仿 followed_songs_db.json 的 {url: song} JSON 文字：n 首歌、n/20 位歌手、一年份的日期"""
+    rnd = random.Random(seed)
+    artists = [f"Artist {i:05d}" for i in range(max(1, n // 20))]
+    tag_sets = [["初心者"], ["U-リク"], ["動画"], ["初心者", "動画プラス"], ["ピアノソロ"], []]
+    start = datetime.date(2025, 1, 1)
+    db = {}
+    for i in range(n):
+        url = f"https://www.ufret.jp/song.php?data={100000 + i}"
+        db[url] = {
+            "title": f"Song title {i}", "artist": rnd.choice(artists), "url": url, "tags": rnd.choice(tag_sets),
+            "is_piano": False, "is_video": False, "is_piano_solo": rnd.random() < 0.01,
+            "discovered_at": (start + datetime.timedelta(days=rnd.randrange(365))).isoformat(),
+        }
+    return json.dumps(db, ensure_ascii=False, indent=2)
+
+
+def retained_mb(build):
+    """build() 回傳的物件在 GC 後仍占用的記憶體 (tracemalloc, MB)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        obj = build()
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0] / 2**20, obj
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(repeat, n=100_000):
+    """100k 首歌的 db_perm：json.load 出來的 dict vs slotted Song (interned 字串)"""
+    text = synthetic_db_perm(n)
+    dict_mb, dicts = retained_mb(lambda: json.loads(text))
+    song_mb, songs = retained_mb(lambda: songs_from_json(json.loads(text)))
+    assert {u: s.to_dict() for u, s in songs.items()} == dicts
+    table = Table(title=f"Resident size of a {n:,}-song db_perm")
+    for col in ("representation", "MB", "bytes / song"): table.add_column(col, justify="left" if col == "representation" else "right")
+    table.add_row("dict (json.load)", f"{dict_mb:.1f}", f"{dict_mb * 2**20 / n:.0f}")
+    table.add_row("Song (slots + intern)", f"{song_mb:.1f}", f"{song_mb * 2**20 / n:.0f}")
+    console.print(table)
+    console.print(f"Song saves {(1 - song_mb / dict_mb) * 100:.0f}% (round-trip to_dict() identical)")
+
+
+def bench_persist(repeat, n=100_000, delta=50):
+    """一次 sync 存檔：整檔重寫 (v19.5.8 的 save_json) vs journal append (JsonPool.flush)"""
+    text = synthetic_db_perm(n)
+    d = datetime.date.today().isoformat()
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, "followed_songs_db.json")
+        with open(fn, "w", encoding="utf-8") as f: f.write(text)
+        pool = JsonPool(fn)
+        pool.COMPACT_EVERY = n  # 量測期間不觸發 compact
+        rounds = iter(range(10**9))
+
+        def touch():
+            r = next(rounds)
+            for i in range(delta):
+                url = f"https://www.ufret.jp/song.php?data={900000 + r * delta + i}"
+                pool[url] = Song(f"New {i}", "Artist 00001", url, ["初心者"], discovered_at=d)
+
+        def legacy():
+            touch()
+            with open(fn, "w", encoding="utf-8") as f: json.dump(pool, f, ensure_ascii=False, indent=2, default=lambda s: s.to_dict())
+
+        def atomic():
+            touch()
+            save_json(fn, pool)
+
+        def journal():
+            touch()
+            pool.flush()
+
+        table = Table(title=f"Persist {delta} new songs into a {n:,}-song db_perm (median of {repeat}, ms)")
+        for col in ("strategy", "ms"): table.add_column(col, justify="left" if col == "strategy" else "right")
+        for name, run in (("open('w') + json.dump", legacy), ("atomic save_json", atomic), ("journal append", journal)):
+            table.add_row(name, f"{timeit(run, repeat)[0]:.1f}")
+        t0 = time.perf_counter()
+        pool.compact()
+        table.add_row("compact (every COMPACT_EVERY changes)", f"{(time.perf_counter() - t0) * 1000:.1f}")
+    console.print(table)
+
+
+def bench_codec(repeat, n=100_000):
+    """100k 首歌的 db_perm：各 codec × pretty / compact 的 load、save 時間與檔案大小
+
+    decode 只有 codec.loads；load 再加上 songs_from_json (啟動時實際要做的事)；save 為 {url: Song} 序列化成 bytes (不含寫檔)。
+    """
+    songs = songs_from_json(json.loads(synthetic_db_perm(n)))
+    baseline = json.dumps(songs, ensure_ascii=False, indent=2, default=lambda s: s.to_dict()).encode("utf-8")
+    table = Table(title=f"JSON codecs on a {n:,}-song db_perm (median of {repeat})")
+    for col in ("codec", "format", "MB", "decode ms", "load ms", "save ms", "round-trip"):
+        table.add_column(col, justify="left" if col in ("codec", "format") else "right")
+    for name, cls in CODECS.items():
+        codec = cls()
+        for pretty in (True, False):
+            save_ms, raw = timeit(lambda: codec.dumps(songs, pretty), repeat)
+            decode_ms, _ = timeit(lambda: codec.loads(raw), repeat)
+            load_ms, loaded = timeit(lambda: songs_from_json(codec.loads(raw)), repeat)
+            ok = loaded == songs and list(loaded) == list(songs) and (not pretty or raw == baseline)
+            table.add_row(name, "pretty" if pretty else "compact", f"{len(raw) / 2**20:.1f}",
+                          f"{decode_ms:.0f}", f"{load_ms:.0f}", f"{save_ms:.0f}", "yes" if ok else "[red]NO[/red]")
+    console.print(table)
+    console.print("round-trip：載回後與原資料相同；pretty 另外要求與 v19.5.8 的 json.dump(indent=2) 輸出逐 byte 相同")
+
+
+def bench_startup(repeat, n=100_000):
+    """db_perm 冷啟動：JsonPool (整份載入) vs LazyJsonPool (mmap + index)，以及一次首頁會做的查詢"""
+    text = synthetic_db_perm(n)
+    urls = [f"https://www.ufret.jp/song.php?data={100000 + i}" for i in range(0, n, n // 50)]
+    table = Table(title=f"Open a {n:,}-song db_perm (median of {repeat})")
+    for col in ("pool", "open ms", "retained MB", "UI queries ms", "identical"):
+        table.add_column(col, justify="left" if col == "pool" else "right")
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, "followed_songs_db.json")
+        with open(fn, "w", encoding="utf-8") as f: f.write(text)
+        LazyJsonPool(fn).close()  # 第一次開啟時建立 .idx (一次性的搬移成本)
+        results = []
+        for cls in (JsonPool, LazyJsonPool):
+            open_ms, pool = timeit(lambda: cls(fn), repeat)
+            mb, pool = retained_mb(lambda: cls(fn))
+            query = lambda: (pool.piano_solo(), [pool.get(u) for u in urls], [u in pool for u in urls], len(pool))
+            query_ms, out = timeit(query, repeat)
+            results.append(out)
+            table.add_row(cls.__name__, f"{open_ms:.1f}", f"{mb:.1f}", f"{query_ms:.2f}", "yes" if out == results[0] else "[red]NO[/red]")
+            if isinstance(pool, LazyJsonPool): pool.close()
+    console.print(table)
+
+
+def bench_artists(repeat, n_followed=1000, n_songs=50_000):
+    """關注歌手比對：1k 位關注歌手 × 50k 首歌 (一半的關注名稱會出現在歌曲裡)
+
+    v19.5.8 的寫法只跑一次 (約數秒)；matcher 分成 cold (每首歌都重新掃描) 與 cached (依歌手名稱快取)。
+    """
+    rnd = random.Random(16)
+    artists = [f"Artist {i:05d}" for i in range(n_songs // 20)] + [f"アーティスト{i}" for i in range(200)]
+    songs = [Song(f"Song {i}", rnd.choice(artists), f"https://www.ufret.jp/song.php?data={i}") for i in range(n_songs)]
+    followed = [f"artist {i:05d}" for i in rnd.sample(range(n_songs // 20), n_followed // 2)] + [f"Band {i}" for i in range(n_followed // 2)]
+
+    def legacy():
+        return [any(f.lower() in s.artist.lower() for f in followed) for s in songs]
+
+    def cold():
+        m = ArtistMatcher(followed)
+        return [m.search(s.artist) for s in songs]
+
+    def cached():
+        m = ArtistMatcher(followed)
+        return [m(s.artist) for s in songs]
+
+    build_ms, _ = timeit(lambda: ArtistMatcher(followed), repeat)
+    legacy_ms, expected = timeit(legacy, 1)
+    table = Table(title=f"Followed-artist matching, {n_followed:,} artists × {n_songs:,} songs")
+    for col in ("method", "ms", "µs / song", "identical"): table.add_column(col, justify="left" if col == "method" else "right")
+    table.add_row("any(f.lower() in artist.lower())", f"{legacy_ms:.0f}", f"{legacy_ms * 1000 / n_songs:.1f}", "-")
+    for name, run in (("Aho–Corasick (cold)", cold), ("Aho–Corasick + cache", cached)):
+        ms, out = timeit(run, repeat)
+        table.add_row(name, f"{ms:.0f}", f"{ms * 1000 / n_songs:.2f}", "yes" if out == expected else "[red]NO[/red]")
+    console.print(table)
+    console.print(f"automaton build: {build_ms:.1f} ms (每次 follow / unfollow)；{sum(expected):,} 首歌命中")
+
+
+def bench_canonical(repeat, n=100_000):
+    """舊 sqlite 的一次性 canonical url 搬移：每 10 首有一首同時存在別名 url 與 canonical url (別名排在前面)"""
+    rows, expected = [], []
+    for i in range(n):
+        sid = 100000 + i
+        canon = f"https://www.ufret.jp/song.php?data={sid}"
+        urls = [f"http://ufret.jp/song.php?data={sid}&x=1", canon] if i % 10 == 0 else [canon if i % 3 else f"http://www.ufret.jp/song.php?data={sid}"]
+        for url in urls: rows.append(("perm", url, sid, f"Song {i}", "Artist", "artist", len(rows)))
+        expected.append((canon, len(rows) - len(urls)))
+    table = Table(title=f"Canonicalize {n:,} songs with alias duplicates (median of {repeat})")
+    for col in ("rows", "aliases", "ms", "identical"): table.add_column(col, justify="right")
+    times, ok = [], True
+    with tempfile.TemporaryDirectory() as tmp:
+        for r in range(repeat):
+            db = SqliteStorage(os.path.join(tmp, f"c{r}.db"), {}, {})
+            db.conn.executemany("INSERT INTO songs (pool, url, song_id, title, artist, artist_lc, position) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            t0 = time.perf_counter()
+            db.canonicalize()
+            times.append((time.perf_counter() - t0) * 1000)
+            # 每首歌只剩一筆 canonical url，且保留位置最前那筆
+            ok &= db.query("SELECT url, position FROM songs WHERE pool = 'perm' ORDER BY position") == expected
+            db.conn.close()
+    table.add_row(f"{len(rows):,}", f"{len(rows) - n:,}", f"{statistics.median(times):.0f}", "yes" if ok else "[red]NO[/red]")
+    console.print(table)
+
+
+BENCHES = {
+    "parse": bench_parse, "region": bench_region, "items": bench_items, "memory": bench_memory,
+    "persist": bench_persist, "codec": bench_codec, "startup": bench_startup, "artists": bench_artists,
+    "canonical": bench_canonical,
+}
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    repeat = 5
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+    for name in args or BENCHES:
+        BENCHES[name](repeat)
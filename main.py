@@ -6,11 +6,32 @@ import os
 import json
 import threading
 import time
-import re
-from flask import Flask, render_template_string, request, jsonify
-from bs4 import BeautifulSoup
+import atexit
+import signal
+import hashlib
+import gzip
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from flask import Flask, Response, render_template_string, request, jsonify
+from parsers import get_parser, listing_region, song_region
+from models import Song, Favorites, canonical_url
+from matcher import ArtistMatcher
+from storage import open_storage, load_txt, save_txt, load_json, save_json, stage_json, WriteBehind
 from rich.console import Console
-from urllib.parse import urljoin
+from urllib.parse import urlsplit
+
+try:
+    import h2  # noqa: F401  (httpx[http2] 的可選依賴)
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
 
 if sys.stdout.encoding != 'utf-8' and hasattr(sys.stdout, 'reconfigure'):
     sys.stdout.reconfigure(encoding='utf-8')
@@ -18,6 +39,154 @@ if sys.stdout.encoding != 'utf-8' and hasattr(sys.stdout, 'reconfigure'):
 app = Flask(__name__)
 console = Console()
 
+class AsyncRunner:
+    """單一背景 event loop thread；其他 thread 透過 run_coroutine_threadsafe 提交 coroutine"""
+    def __init__(self, name="ufret-loop"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Lazy start：import 時不建立 thread (Gunicorn fork 前不要有 loop)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            return self.loop
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """提交 coroutine，回傳 concurrent.futures.Future (不等待)"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro, timeout=None):
+        """提交並等待結果；逾時拋出 TimeoutError，但工作會繼續在背景完成"""
+        return self.submit(coro).result(timeout)
+
+    @staticmethod
+    async def _cancel_pending():
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None: return
+            # 先取消進行中的工作 (sync、backfill worker)，讓它們的 finally / CancelledError 處理跑完
+            try: asyncio.run_coroutine_threadsafe(self._cancel_pending(), self.loop).result(timeout=5)
+            except Exception: pass
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+            self.loop.close()
+            self._thread = None
+
+class HttpCache:
+    """來源頁的 on-disk conditional GET 快取：保存 ETag / Last-Modified 與 body 雜湊
+
+    200 回應的 validators 先放在 pending，等 sync 合併完成後 commit() 才生效並寫入 index.json，
+    避免合併中途失敗後下次被 304 / 雜湊相同擋掉而漏掉這批歌曲。
+    """
+    def __init__(self, directory):
+        self.dir = directory
+        self.index_file = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        if not os.path.exists(directory): os.makedirs(directory)
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f: self.entries = json.load(f)
+        except: self.entries = {}
+        self.pending = {}
+        self.stats = {"not_modified": 0, "unchanged": 0, "miss": 0, "bytes_saved": 0, "parse_seconds_saved": 0.0}
+
+    def validators(self, url):
+        e = self.entries.get(url) or {}
+        h = {}
+        if e.get("etag"): h["If-None-Match"] = e["etag"]
+        if e.get("last_modified"): h["If-Modified-Since"] = e["last_modified"]
+        return h
+
+    def not_modified(self, url):
+        """Server 回 304：整份 body 與解析都省下"""
+        with self._lock:
+            e = self.entries.get(url, {})
+            self.stats["not_modified"] += 1
+            self.stats["bytes_saved"] += e.get("size", 0)
+            self.stats["parse_seconds_saved"] = round(self.stats["parse_seconds_saved"] + e.get("parse_seconds", 0), 4)
+
+    def store(self, url, r, body):
+        """200 回應：暫存新的 validators (commit 前不生效)；回傳 body 是否與上次 commit 的不同"""
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            e = self.entries.get(url, {})
+            changed = e.get("sha256") != digest
+            if changed: self.stats["miss"] += 1
+            else:
+                self.stats["unchanged"] += 1
+                self.stats["parse_seconds_saved"] = round(self.stats["parse_seconds_saved"] + e.get("parse_seconds", 0), 4)
+            validators = {"etag": r.headers.get("etag"), "last_modified": r.headers.get("last-modified")}
+            if changed or any(e.get(k) != v for k, v in validators.items()):
+                self.pending[url] = {**e, **validators, "sha256": digest, "size": len(body),
+                                     "fetched_at": datetime.datetime.now().isoformat(timespec="seconds")}
+        return changed
+
+    def record_parse(self, url, seconds):
+        with self._lock:
+            e = self.pending.get(url)
+            if e is not None: e["parse_seconds"] = round(seconds, 4)
+
+    def commit(self, urls):
+        """合併完成：這些來源暫存的 validators 生效；回傳是否需要寫檔"""
+        with self._lock:
+            done = {url: self.pending.pop(url) for url in urls if url in self.pending}
+            self.entries.update(done)
+        return bool(done)
+
+    def stage(self):
+        """flusher 的分段 writer：鎖內序列化，鎖外寫檔"""
+        with self._lock: return stage_json(self.index_file, self.entries)
+
+class EventBus:
+    """Server-Sent Events 的來源：事件帶遞增 id 放進固定大小的 ring buffer
+
+    斷線重連的 client 帶 Last-Event-ID 即可補收錯過的事件；落後超過 buffer 時只能請它整頁重新載入。
+    """
+    BUFFER = int(os.environ.get("UFRET_EVENT_BUFFER", 256))
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=self.BUFFER)  # (id, 事件名稱, data)
+        self.last_id = 0
+
+    def publish(self, kind, **data):
+        with self._cond:
+            self.last_id += 1
+            self._events.append((self.last_id, kind, data))
+            self._cond.notify_all()
+
+    def since(self, last_id, timeout=None):
+        """回傳 (last_id 之後的事件, 是否有事件已被擠出 buffer)；目前沒有新事件時最多等 timeout 秒"""
+        with self._cond:
+            if last_id > self.last_id: return [], True  # server 重啟過，id 從頭算
+            if self.last_id == last_id: self._cond.wait(timeout)
+            events = [e for e in self._events if e[0] > last_id]
+            return events, bool(events) and events[0][0] > last_id + 1
+
+@dataclass(frozen=True, slots=True)
+class UiSnapshot:
+    """畫面讀取用的 snapshot：writer 在 mutate() 結束時建好新版本後整個換上 (單一屬性指定)，reader 完全不加鎖
+
+    views 的每個值都是 tuple；positions 只是分頁用的衍生快取，第一次需要時才填。
+    """
+    version: int
+    views: dict          # 分頁名稱 -> tuple[Song]；"missing" 為尚未抓到元數據的收藏 url
+    matcher: ArtistMatcher
+    favorites: Favorites
+    positions: dict = field(default_factory=dict)  # 分頁名稱 -> {url: 位置}
+
 class UfretCrawler:
     NEW_URL = "https://www.ufret.jp/new.php"
     PIANO_URL = "https://www.ufret.jp/piano.php"
@@ -29,268 +198,627 @@ class UfretCrawler:
     ARTISTS_FILE = os.path.join(DATA_DIR, "followed_artists.txt")
     FAVORITES_FILE = os.path.join(DATA_DIR, "favorites.txt")
     DB_LAST_SYNC = os.path.join(DATA_DIR, "last_sync.json")
+    HTTP_CACHE_DIR = os.path.join(DATA_DIR, "http_cache")
+    DB_SOURCE_STATE = os.path.join(DATA_DIR, "source_state.json")
+    DB_SQLITE = os.path.join(DATA_DIR, "ufret.db")
+    # 儲存引擎：json (預設，沿用上面的 JSON / txt 檔) 或 sqlite (第一次啟動時自動搬移)
+    STORAGE = os.environ.get("UFRET_STORAGE", "json")
+    # json 引擎的 db_perm 以 mmap + offset index 延遲載入 (啟動時間與記憶體不隨歌曲數成長)
+    LAZY_PERM = os.environ.get("UFRET_LAZY_PERM", "1") == "1"
+
+    # Connection pool: 所有抓取共用同一組 keep-alive 連線，可用環境變數調整
+    HTTP_MAX_CONNECTIONS = int(os.environ.get("UFRET_HTTP_MAX_CONNECTIONS", 10))
+    HTTP_MAX_KEEPALIVE = int(os.environ.get("UFRET_HTTP_MAX_KEEPALIVE", 5))
+    HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("UFRET_HTTP_KEEPALIVE_EXPIRY", 60))
+    HTTP2 = os.environ.get("UFRET_HTTP2", "1") == "1"
+    SYNC_CONCURRENCY = int(os.environ.get("UFRET_SYNC_CONCURRENCY", 4))
+    # 讀到需要的部分就停止讀取 body：auto 只在 HTTP/2 時停 (HTTP/1.1 提早結束會丟掉 keep-alive 連線)；1 一律停，0 不停
+    STREAM_EARLY_STOP = os.environ.get("UFRET_STREAM_EARLY_STOP", "auto")
+    # Write-behind：變動後 FLUSH_DELAY 秒內沒有新變動才寫檔，連續變動時最晚 FLUSH_MAX_DELAY 秒
+    FLUSH_DELAY = float(os.environ.get("UFRET_FLUSH_DELAY", 2))
+    FLUSH_MAX_DELAY = float(os.environ.get("UFRET_FLUSH_MAX_DELAY", 10))
+    LIST_ATTRS = {"favorites": "favorite_urls", "followed_artists": "followed_artists"}
+    # 各分頁的 materialized view：變動 (persist 的名稱) -> 需要重建的分頁；其餘分頁沿用上次的結果
+    VIEWS = ("general", "video", "piano", "followed", "favorites")
+    DERIVED = VIEWS + ("missing",)
+    VIEW_DEPS = {
+        "general": ("general", "piano", "followed", "favorites"),
+        "video": ("video", "piano", "followed", "favorites"),
+        "perm": ("piano", "favorites", "missing"),
+        "favorites": ("favorites", "missing"),
+        "followed_artists": ("followed",),
+    }
+    # /api/songs 每頁筆數 (首頁只 render 第一個分頁的第一頁)
+    PAGE_SIZE = int(os.environ.get("UFRET_PAGE_SIZE", 60))
+    MAX_PAGE_SIZE = int(os.environ.get("UFRET_MAX_PAGE_SIZE", 200))
     
     def __init__(self):
         if not os.path.exists(self.DATA_DIR): os.makedirs(self.DATA_DIR)
         self.headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"}
         self.lock = threading.RLock()
-        self.followed_artists = self.load_txt(self.ARTISTS_FILE)
-        self.favorite_urls = self.load_txt(self.FAVORITES_FILE)
-        self.db_general = self.load_json(self.DB_GENERAL)
-        self.db_video = self.load_json(self.DB_VIDEO)
-        self.db_perm = self.load_json(self.DB_PERMANENT)
+        self.runner = AsyncRunner()
+        self.events = EventBus()
+        self.flusher = WriteBehind(self.lock, self.FLUSH_DELAY, self.FLUSH_MAX_DELAY)
+        self.list_versions = dict.fromkeys(self.LIST_ATTRS, 0)  # 清單每次 persist() +1 (reload_lists 判斷讀檔後是否又被改過)
+        self.http_cache = HttpCache(self.HTTP_CACHE_DIR)
+        self.parser = get_parser()
+        self._client = None
+        self.artist_matcher = ArtistMatcher()
+        # reader 只讀 self.snapshot；self.lock 只在 writer 之間互斥 (以及 flusher 序列化時，寫檔本身在鎖外)
+        self._stale = set(self.DERIVED)  # 已被 touch()、下次 publish() 要重建的 view
+        self.snapshot = UiSnapshot(0, dict.fromkeys(self.DERIVED, ()), self.artist_matcher, Favorites())
+        self.storage = open_storage(
+            self.STORAGE, self.DB_SQLITE,
+            {"general": self.DB_GENERAL, "video": self.DB_VIDEO, "perm": self.DB_PERMANENT},
+            {"favorites": self.FAVORITES_FILE, "followed_artists": self.ARTISTS_FILE},
+            lazy_pools=("perm",) if self.LAZY_PERM else (),
+        )
+        if getattr(self.storage, "migrated", None):
+            console.print(f"[yellow]Migrated JSON data into {self.DB_SQLITE}: {self.storage.migrated}[/yellow]")
+        self.followed_artists = self.load_list("followed_artists")
+        self.favorite_urls = self.load_list("favorites")
+        self.db_general = self.storage.pool("general")
+        self.db_video = self.storage.pool("video")
+        self.db_perm = self.storage.pool("perm")
+        self.source_state = self.load_json(self.DB_SOURCE_STATE)
         self.sanitize_database()
 
+    @contextmanager
+    def mutate(self):
+        """writer 的臨界區：修改 pool / 清單後離開時 publish()，reader 一次看到整批變動"""
+        with self.lock:
+            try: yield
+            finally: self.publish()
+
+    def publish(self):
+        """重建被 touch() 的 view (其餘沿用上一版) 並換上新的 snapshot；呼叫端持有 self.lock"""
+        if not self._stale: return self.snapshot
+        old = self.snapshot
+        views = dict(old.views)
+        for name in self._stale: views[name] = tuple(getattr(self, "_view_" + name)())
+        self._stale = set()
+        self.snapshot = UiSnapshot(old.version + 1, views, self.artist_matcher, self.favorite_urls)
+        return self.snapshot
+
+    @property
+    def data_version(self):
+        """每次 publish() 換上新 snapshot 時 +1 (PageCache 以此判斷是否要重新 render)"""
+        return self.snapshot.version
+
     def sanitize_database(self):
         """一次性清理資料庫中的 Unknown 歌手與無效連結"""
-        with self.lock:
-            initial_count = len(self.db_perm)
-            self.db_perm = {
-                url: s for url, s in self.db_perm.items() 
-                if s.get("artist") != "Unknown" and "song.php?data=" in url
-            }
-            if len(self.db_perm) != initial_count:
-                console.print(f"[yellow]Sanitized Database: Removed {initial_count - len(self.db_perm)} noise items.[/yellow]")
-                self.save_json(self.DB_PERMANENT, self.db_perm)
+        with self.mutate():
+            removed = self.db_perm.sanitize()
+            if removed:
+                console.print(f"[yellow]Sanitized Database: Removed {removed} noise items.[/yellow]")
+                self.persist("perm")
 
-    def load_txt(self, fn):
-        if not os.path.exists(fn): return []
-        try:
-            with open(fn, "r", encoding="utf-8") as f: return [l.strip() for l in f if l.strip() and not l.startswith("#")]
-        except: return []
+    @property
+    def followed_artists(self):
+        return self._followed_artists
+
+    @followed_artists.setter
+    def followed_artists(self, names):
+        # 關注清單變動時重建 matcher (內容相同時沿用，保留快取)；先建好再換上，reader 不需加鎖
+        if tuple(names) != self.artist_matcher.names:
+            self.artist_matcher = ArtistMatcher(names)
+            self.touch("followed_artists")
+        self._followed_artists = names
+
+    def is_followed(self, artist):
+        return self.artist_matcher(artist)
+
+    @property
+    def favorite_urls(self):
+        return self._favorites
+
+    @favorite_urls.setter
+    def favorite_urls(self, urls):
+        # 依 song id 去重 (舊版 add_url 會重複 append) 並換成 canonical url；有變動時把整理後的清單寫回
+        favs = urls if isinstance(urls, Favorites) else Favorites(urls)
+        if list(favs) != list(getattr(self, "_favorites", ())): self.touch("favorites")
+        self._favorites = favs
+        if not isinstance(urls, Favorites) and list(favs) != list(urls): self.persist("favorites")
+
+    def load_txt(self, fn): return load_txt(fn)
 
     def save_txt(self, fn, d):
-        with self.lock:
-            try:
-                with open(fn, "w", encoding="utf-8") as f: f.write("\n".join(d)+"\n")
-                return True
-            except: return False
+        with self.lock: return save_txt(fn, d)
 
-    def load_json(self, fn):
-        if not os.path.exists(fn): return {}
-        try:
-            with open(fn, "r", encoding="utf-8") as f: return json.load(f)
-        except: return {}
+    def load_json(self, fn): return load_json(fn)
 
-    def save_json(self, fn, d):
-        try:
-            with open(fn, "w", encoding="utf-8") as f: json.dump(d, f, ensure_ascii=False, indent=2)
-            return True
-        except: return False
+    def save_json(self, fn, d): return save_json(fn, d)
 
-    async def fetch_page(self, client, url):
-        try:
-            r = await client.get(url, headers=self.headers, follow_redirects=True, timeout=12)
+    def load_list(self, name):
+        """favorites / followed_artists 從磁碟重新讀取 (手動編輯的 txt 也會生效)；尚未寫出的變動先寫出"""
+        self.flusher.flush(name)
+        return self.storage.load_list(name)
+
+    def persist(self, name, writer=None):
+        """標記 dirty，交給 flusher 在 debounce 後寫入：pool 名稱 (general / video / perm)、清單名稱，或自訂 writer"""
+        if name in self.LIST_ATTRS: self.list_versions[name] += 1
+        if writer is None:
+            if name in self.LIST_ATTRS: writer = lambda: self.storage.stage_list(name, list(getattr(self, self.LIST_ATTRS[name])))
+            else: writer = getattr(self, "db_" + name).flush_steps
+        self.touch(name)
+        self.flusher.mark(name, writer)
+
+    def touch(self, name):
+        """name 的資料變了：標記依賴它的 view，下次 publish() 只重建這幾個"""
+        self._stale.update(self.VIEW_DEPS.get(name, ()))
+
+    @property
+    def client(self):
+        """Process-wide httpx 連線池，只在 runner 的 event loop 內使用，第一次使用時才建立"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers, follow_redirects=True, timeout=12,
+                http2=self.HTTP2 and HAS_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=self.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=self.HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=self.HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._client
+
+    def submit(self, coro):
+        return self.runner.submit(coro)
+
+    def run(self, coro, timeout=None):
+        return self.runner.run(coro, timeout)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self):
+        """Shutdown hook: 關閉連線池並停止背景 event loop"""
+        if self.runner.loop is not None and self.runner.loop.is_running():
+            try: self.run(self.aclose(), timeout=5)
+            except Exception: pass
+        self.runner.stop()
+        self.flusher.stop()
+        self.storage.close()
+
+    async def _get(self, url, headers=None, until=None):
+        """Streaming GET；until(已讀內容) 為 True 時停止讀取剩下的 body，回傳 (response, text)"""
+        async with self.client.stream("GET", url, headers=headers) as r:
+            if r.status_code == 304: return r, None
             r.raise_for_status()
-            return r.text
+            # HTTP/2 只 reset 這個 stream；HTTP/1.1 則會放棄該條 keep-alive 連線，auto 時讀完整份 body 以重用連線
+            mode = self.STREAM_EARLY_STOP
+            if mode == "0" or (mode == "auto" and r.http_version != "HTTP/2"): until = None
+            buf = ""
+            async for chunk in r.aiter_text():
+                buf += chunk
+                if until and until(buf): break
+            return r, buf
+
+    async def fetch_page(self, url, until=None):
+        try:
+            return (await self._get(url, until=until))[1]
         except Exception as e:
             console.print(f"[red]Error {url}: {e}[/red]")
             return None
 
-    def parse_song_item(self, item, base_url):
+    async def fetch_source(self, url, until=None):
+        """Conditional GET：回傳 (html, changed)；304 或 body 雜湊不變時 html=None, changed=False"""
         try:
-            link_tag = item if item.name == "a" else item.find("a")
-            if not link_tag: return None
-            href = link_tag.get("href", "")
-            if "song.php?data=" not in href: return None # 關鍵：排除非歌曲連結（如導覽鈕）
-            url = urljoin(base_url, href)
-            
-            badges = [t.text.strip() for t in item.select("span.badge")]
-            artist_tag = item.find("span", style=lambda s: s and ("font-size:12px" in s or "font-size: 12px" in s))
-            
-            # Robust Artist Parsing
-            full_text = link_tag.get_text("|||", strip=True)
-            if artist_tag:
-                artist = artist_tag.get_text().strip()
-                if artist.startswith("-"): artist = artist[1:].strip()
-            else:
-                # Try parsing from "Title - Artist" format (common on pickup pages)
-                clean_raw = link_tag.get_text().strip()
-                if " - " in clean_raw:
-                    artist = clean_raw.split(" - ")[-1].strip()
-                else:
-                    artist = "Unknown"
-
-            # 2. 解析標題 (Title) - 優先讀取 <strong> 標籤 (針對 Piano Solo 頁面結構)
-            strong_tag = link_tag.find("strong")
-            if strong_tag:
-                raw_title = strong_tag.get_text().strip()
-            else:
-                parts = [p.strip() for p in full_text.split("|||") if p.strip()]
-                clean_parts = [p for p in parts if p!=artist and p not in badges and "追加" not in p and "NEW" not in p and p!="U-リク" and p!="-"]
-                raw_title = clean_parts[0] if clean_parts else "Unknown"
-
-            # 3. 如果標題內還殘留歌手（由連字號切分），再次清理
-            if " - " in raw_title: raw_title = raw_title.split(" - ")[0].strip()
-            
-            clean_pattern = r"(U-リク|NEW|追加|初心者|動画プラス|ピアノソロ|ソロ|初級|\d{4}/\d{2}/\d{2})"
-            title = re.sub(clean_pattern, "", raw_title).strip().lstrip("-").strip()
-            if not title: title = "Unknown Song"
-
-            is_piano = any("ピアノ" in t for t in badges)
-            is_video = any("動画" in t for t in badges)
-
-            return {
-                "title": title, "artist": artist, "url": url, "tags": badges, 
-                "is_piano": is_piano, "is_video": is_video,
-                "is_piano_solo": False, # v19.5.7: 預設 False，僅精選區設為 True
-                "discovered_at": datetime.datetime.now().strftime("%Y-%m-%d")
-            }
-        except: return None
+            r, html = await self._get(url, headers=self.http_cache.validators(url), until=until)
+            if html is None:
+                self.http_cache.not_modified(url)
+                return None, False
+        except Exception as e:
+            console.print(f"[red]Error {url}: {e}[/red]")
+            return None, True
+        if not self.http_cache.store(url, r, html.encode()): return None, False
+        return html, True
 
     def deduplicate_songs(self, songs):
         seen = set()
         unique = []
         for s in songs:
             # Create a unique key based on title and artist
-            key = (s["title"], s["artist"])
+            # (同一首歌的不同編曲 / U-リク版各有自己的 song id，畫面上只列一次；同一 id 的重複已在 key 層合併)
+            key = (s.title, s.artist)
             if key not in seen:
                 seen.add(key)
                 unique.append(s)
         return unique
 
-    async def scrape_all(self):
-        c_followed = self.load_txt(self.ARTISTS_FILE)
-        c_favs = self.load_txt(self.FAVORITES_FILE)
-        with self.lock:
-            self.followed_artists = c_followed
-            self.favorite_urls = c_favs
+    def parse_listing(self, html, base_url, limit):
+        return self.parser.listing(html, base_url, limit)
+
+    def listing_fingerprint(self, songs):
+        """列表指紋：依序串起解析出的歌曲 (不含 discovered_at) 後取雜湊；沒有任何歌曲時回傳 None (不可用來判斷未變動)"""
+        if not songs: return None
+        h = hashlib.sha1()
+        for s in songs: h.update(json.dumps([s.url, s.title, s.artist, s.tags, s.is_piano, s.is_video], ensure_ascii=False).encode())
+        return h.hexdigest()
+
+    async def scrape_source(self, sem, url, limit, force=False, fingerprints=None):
+        """抓取單一列表頁並解析 (semaphore 限制同時連線數)；來源未變動時回傳 None"""
+        # 只需要前 limit 個項目：湊滿就停止讀取剩下的 body
+        until = lambda buf: listing_region(buf, limit)[1]
+        async with sem:
+            if force: html, changed = await self.fetch_page(url, until), True
+            else: html, changed = await self.fetch_source(url, until)
+        self.events.publish("page", url=url, changed=bool(changed and html))
+        if not changed: return None
+        if not html: return []
+        # 解析是 CPU-bound，丟到 worker thread 以免卡住其他來源 (只解析 list-group 區塊，幾 ms)
+        t0 = time.perf_counter()
+        songs = await asyncio.to_thread(self.parse_listing, html, url, limit)
+        self.http_cache.record_parse(url, time.perf_counter() - t0)
+        # body 變了 (廣告、時間戳) 但解析出的歌曲沒變：跳過合併；解析不到歌曲時一律照常合併
+        fp = self.listing_fingerprint(songs)
+        if fp is None:
+            console.print(f"[yellow]No songs parsed from {url}[/yellow]")
+            return songs
+        if not force and self.source_state.get(url, {}).get("fingerprint") == fp: return None
+        if fingerprints is not None: fingerprints[url] = fp
+        return songs
+
+    async def scrape_all(self, force=False, run_id=None):
+        """同步並透過 self.events 發出 sync started / done (或 error) 事件"""
+        self.events.publish("sync", state="started", run_id=run_id)
+        version = self.data_version
+        try: ok = await self._scrape_all(force)
+        except Exception as e:
+            self.events.publish("sync", state="error", run_id=run_id, error=str(e) or type(e).__name__)
+            raise
+        self.events.publish("sync", state="done", run_id=run_id, changed=self.data_version != version, counts=self.view_counts())
+        return ok
+
+    def reload_lists(self):
+        """從磁碟重新讀取關注與收藏清單 (手動編輯的 txt 也會生效)
+
+        讀檔 (會先 flush) 不能持有 self.lock；讀檔後才被 /api/follow、/api/favorite 改過的清單不套用，
+        否則記憶體裡的變動會被舊內容蓋掉，之後 write-behind 再把舊內容寫回磁碟。
+        """
+        with self.lock: versions = dict(self.list_versions)
+        loaded = {name: self.load_list(name) for name in self.LIST_ATTRS}
+        with self.mutate():
+            for name, items in loaded.items():
+                if self.list_versions[name] == versions[name]: setattr(self, self.LIST_ATTRS[name], items)
+
+    async def _scrape_all(self, force=False):
+        # self.lock 是 threading.RLock：持鎖的部分一律丟到 worker thread，event loop 不等 writer / flusher
+        await asyncio.to_thread(self.reload_lists)
         
-        async with httpx.AsyncClient() as client:
-            # 1. Scrape New Releases
-            html_new = await self.fetch_page(client, self.NEW_URL)
-            items_new = []
-            if html_new:
-                soup = BeautifulSoup(html_new, "html.parser")
-                items_new = soup.select("div.list-group a.list-group-item")[:100]
-
-            # 2. Scrape Piano Solo TAG Page (The definitive source for the Piano tab)
-            html_t = await self.fetch_page(client, self.PIANO_TAG_URL)
-            items_t = []
-            if html_t:
-                items_t = BeautifulSoup(html_t, "html.parser").select("div.list-group a.list-group-item")[:50]
-
-            scraped_new = []
-            for item in items_new:
-                s = self.parse_song_item(item, self.NEW_URL)
-                if s: scraped_new.append(s)
-
-            # Process piano items and FORCE is_piano_solo = True
-            scraped_piano = []
-            for item in items_t:
-                s = self.parse_song_item(item, self.PIANO_TAG_URL)
-                if s:
-                    s["is_piano"] = True
-                    s["is_piano_solo"] = True # v19.5.8 官方標籤精選
-                    scraped_piano.append(s)
-
-            with self.lock:
-                # Update DB Permanent with piano specific results
-                for s in scraped_piano:
-                    self.db_perm[s["url"]] = s
-
-                new_gen, new_vid = [], []
-                for s in scraped_new:
-                    # v19.5.8: 只有關注的歌手才會存入 db_perm，一般的鋼琴新曲留在 General 即可
-                    if s["is_video"]:
-                        new_vid.append(s)
-                        continue
-                    
-                    # 3. Add to General pipeline (including Piano songs)
-                    new_gen.append(s)
-                    
-                    # 4. If artist followed, archive to DB Permanent
-                    if any(f.lower() in s["artist"].lower() for f in self.followed_artists):
-                        self.db_perm[s["url"]] = s
-                
-                # Combine new and old, then deduplicate by content (Title + Artist)
-                # We prioritize new items (appearing first in the list)
-                raw_gen = new_gen + list(self.db_general.values())
-                updated_gen = self.deduplicate_songs(raw_gen)
-                self.db_general = {s["url"]: s for s in updated_gen[:50]}
-                self.save_json(self.DB_GENERAL, self.db_general)
-
-                raw_vid = new_vid + list(self.db_video.values())
-                updated_vid = self.deduplicate_songs(raw_vid)
-                self.db_video = {s["url"]: s for s in updated_vid[:20]}
-                self.save_json(self.DB_VIDEO, self.db_video)
-
-                self.save_json(self.DB_PERMANENT, self.db_perm)
+        # 資料庫是空的 (例如 volume 重建) 時不信任快取，強制完整解析
+        force = force or not self.db_general
+
+        # 1. New Releases + 2. Piano Solo TAG Page (The definitive source for the Piano tab)
+        # 兩個來源同時抓取，各自的 body 一到就開始解析
+        sem = asyncio.Semaphore(self.SYNC_CONCURRENCY)
+        fingerprints = {}
+        scraped_new, scraped_piano = await asyncio.gather(
+            self.scrape_source(sem, self.NEW_URL, 100, force, fingerprints),
+            self.scrape_source(sem, self.PIANO_TAG_URL, 50, force, fingerprints),
+        )
+        console.print(f"[dim]HTTP cache: {self.http_cache.stats}[/dim]")
+        if scraped_new is None and scraped_piano is None:
+            console.print("[green]Sources unchanged, skipping merge.[/green]")
+            if self.http_cache.commit((self.NEW_URL, self.PIANO_TAG_URL)): self.persist("http_cache", self.http_cache.stage)
+            return True
+        scraped_new, scraped_piano = scraped_new or [], scraped_piano or []
+
+        # Process piano items and FORCE is_piano_solo = True
+        for s in scraped_piano:
+            s.is_piano = True
+            s.is_piano_solo = True # v19.5.8 官方標籤精選
+
+        await asyncio.to_thread(self.merge_scraped, scraped_new, scraped_piano, fingerprints)
         return True
 
-    async def add_url_manually(self, url):
-        async with httpx.AsyncClient() as client:
-            html = await self.fetch_page(client, url)
-            if not html: return None
-            soup = BeautifulSoup(html, "html.parser")
-            h1 = soup.select_one("h1")
-            
-            # Basic parsing for manual add
-            if h1:
-                t_span = h1.find("span", style=lambda s: s and "font-weight:bold" in s)
-                title = t_span.get_text().strip() if t_span else (h1.find(string=True, recursive=False) or "").strip()
-                a_span = h1.find("span", style=lambda s: s and "font-size" in s)
-                artist = a_span.get_text().strip() if a_span else "Unknown"
-            else:
-                title, artist = "Unknown", "Unknown"
-            
-            song = {
-                "title": title, "artist": artist, "url": url, 
-                "tags": [], "discovered_at": datetime.datetime.now().strftime("%Y-%m-%d"),
-                "is_piano": False, "is_video": False
-            }
-            
-            # Check for tags in manual add
-            badges = [t.text.strip() for t in soup.select("span.badge")]
-            song["is_piano"] = any("ピアノ" in t for t in badges)
-            song["is_video"] = any("動画" in t for t in badges)
-            song["tags"] = badges
-
-            with self.lock:
-                self.favorite_urls.append(url)
-                if url not in self.db_perm:
-                    self.db_perm[url] = song
-                self.save_txt(self.FAVORITES_FILE, self.favorite_urls)
-                self.save_json(self.DB_PERMANENT, self.db_perm)
-            return song
-
-    def get_data_for_ui(self):
-        with self.lock:
-            # Current feeds (New Arrivals + Video)
-            active_new = {**self.db_general, **self.db_video}
-            # Permanent pool (Historical followed songs, manually imported, and piano page cache)
-            all_known = {**active_new, **self.db_perm}
-            
-            # 1. Piano: 僅顯示標記為 is_piano_solo 的精選 (回歸 8 首經典)
-            raw_piano = [s for s in all_known.values() if s.get("is_piano_solo")]
-            
-            # 2. Following: Only show songs by followed artists that were newly discovered in current feeds
-            raw_followed = [s for s in active_new.values() if any(f.lower() in s.get("artist","").lower() for f in self.followed_artists)]
+    def merge_scraped(self, scraped_new, scraped_piano, fingerprints):
+        """把抓到的列表併入三個 pool 並標記寫檔 (在 worker thread 執行，持有 self.lock)"""
+        with self.mutate():
+            perm_dirty = False
+            # Update DB Permanent with piano specific results
+            for s in scraped_piano:
+                if self.db_perm.get(s.url) != s:
+                    self.db_perm[s.url] = s
+                    perm_dirty = True
+
+            new_gen, new_vid = [], []
+            for s in scraped_new:
+                # v19.5.8: 只有關注的歌手才會存入 db_perm，一般的鋼琴新曲留在 General 即可
+                if s.is_video:
+                    new_vid.append(s)
+                    continue
+                
+                # 3. Add to General pipeline (including Piano songs)
+                new_gen.append(s)
+                
+                # 4. If artist followed, archive to DB Permanent
+                if self.is_followed(s.artist):
+                    if self.db_perm.get(s.url) != s:
+                        self.db_perm[s.url] = s
+                        perm_dirty = True
             
-            # 3. Favorites (Saved): The permanent list of things you explicitly want to keep.
-            raw_favorites = [s for s in all_known.values() if s["url"] in self.favorite_urls]
-
-            return {
-                "general": list(self.db_general.values()),
-                "video": list(self.db_video.values()),
-                "piano": self.deduplicate_songs(raw_piano),
-                "followed": sorted(self.deduplicate_songs(raw_followed), key=lambda x: x.get("artist", "")),
-                "favorites": self.deduplicate_songs(raw_favorites)
-            }
+            # Combine new and old, then deduplicate by content (Title + Artist)
+            # We prioritize new items (appearing first in the list)
+            # 只有內容 (含順序) 真的變了才寫檔
+            raw_gen = new_gen + list(self.db_general.values())
+            updated_gen = self.deduplicate_songs(raw_gen)
+            db_general = {s.url: s for s in updated_gen[:50]}
+            added = [s for s in db_general.values() if s.url not in self.db_general]
+            if list(db_general.items()) != list(self.db_general.items()):
+                self.db_general.replace(db_general)
+                self.persist("general")
+
+            raw_vid = new_vid + list(self.db_video.values())
+            updated_vid = self.deduplicate_songs(raw_vid)
+            db_video = {s.url: s for s in updated_vid[:20]}
+            added += [s for s in db_video.values() if s.url not in self.db_video]
+            if list(db_video.items()) != list(self.db_video.items()):
+                self.db_video.replace(db_video)
+                self.persist("video")
+
+            if perm_dirty: self.persist("perm")
+            if added: self.events.publish("songs", count=len(added), songs=[{"title": s.title, "artist": s.artist, "url": s.url} for s in added[:10]])
+
+            # 合併寫檔完成後才記錄指紋與 HTTP validators，避免中途失敗後誤判為「未變動」
+            if self.http_cache.commit((self.NEW_URL, self.PIANO_TAG_URL)): self.persist("http_cache", self.http_cache.stage)
+            if fingerprints:
+                for url, fp in fingerprints.items():
+                    self.source_state[url] = {"fingerprint": fp, "updated_at": datetime.datetime.now().isoformat(timespec="seconds")}
+                self.persist("source_state", lambda: stage_json(self.DB_SOURCE_STATE, self.source_state))
+
+    async def fetch_song(self, url):
+        """抓取單曲頁並解析元數據 (不寫入任何資料庫)"""
+        # 單曲頁只需要 <h1>，讀到 </h1> 就停 (約整頁的前 1/3)
+        html = await self.fetch_page(url, until=lambda buf: song_region(buf) is not None)
+        if not html: return None
+        meta = self.parser.song_page(html)
+        return Song(
+            meta["title"], meta["artist"], url, meta["tags"], meta["is_piano"], meta["is_video"],
+            discovered_at=datetime.datetime.now().strftime("%Y-%m-%d"),
+        )
+
+    async def add_url_manually(self, url):
+        """匯入單曲並加入收藏；回傳 (song, 是否為新加入的收藏)，抓取失敗時回傳 None"""
+        url = canonical_url(url)
+        song = await self.fetch_song(url)
+        if not song: return None
+        return song, await asyncio.to_thread(self.save_favorite, url, song)
+
+    def save_favorite(self, url, song):
+        """加入收藏並存入 db_perm (已有的保留原本的資料)；回傳是否為新加入的收藏"""
+        with self.mutate():
+            favs = self.favorite_urls.copy()
+            added = favs.add(url)
+            self.favorite_urls = favs
+            if url not in self.db_perm:
+                self.db_perm[url] = song
+            self.persist("favorites")
+            self.persist("perm")
+        return added
+
+    def find_song(self, url):
+        """依 {**general, **video, **perm} 的優先順序找單一首歌 (perm 為準)"""
+        for pool in (self.db_perm, self.db_video, self.db_general):
+            s = pool.get(url)
+            if s is not None: return s
+        return None
+
+    def known_songs(self, select):
+        """對三個 pool 各自查詢後依 {**general, **video, **perm} 的語意合併 (同 url 以 perm 為準)"""
+        out = {}
+        for pool in (self.db_general, self.db_video, self.db_perm):
+            for s in select(pool): out[s.url] = s
+        return list(out.values())
+
+    def get_data_for_ui(self, snap=None):
+        """目前 snapshot 的各分頁歌曲 (tuple)；不加鎖，sync 或寫檔進行中也不會等待"""
+        views = (snap or self.snapshot).views
+        return {tab: views[tab] for tab in self.VIEWS}
+
+    def view(self, tab, snap=None):
+        return (snap or self.snapshot).views[tab]
+
+    def view_counts(self, snap=None):
+        return {tab: len(songs) for tab, songs in self.get_data_for_ui(snap).items()}
+
+    def view_index(self, tab, snap=None):
+        """view 的 {url: 位置}，第一次需要時才建 (跟著 snapshot 走，不必另外失效)"""
+        snap = snap or self.snapshot
+        positions = snap.positions.get(tab)
+        if positions is None: positions = snap.positions[tab] = {s.url: i for i, s in enumerate(snap.views[tab])}
+        return positions
+
+    def songs_page(self, tab, cursor=None, limit=None, snap=None):
+        """keyset 分頁：cursor 為上一頁最後一首的 url，回傳 (songs, next_cursor, 總數)
+
+        cursor 已不在目前的 view 裡 (其間資料更新) 時丟 KeyError，由呼叫端從頭載入。
+        """
+        limit = limit or self.PAGE_SIZE
+        snap = snap or self.snapshot
+        songs = snap.views[tab]
+        start = self.view_index(tab, snap)[cursor] + 1 if cursor else 0
+        page = songs[start:start + limit]
+        more = start + limit < len(songs)
+        return page, page[-1].url if more and page else None, len(songs)
+
+    def _view_missing(self):
+        # 還沒有元數據 (不在 db_perm) 的收藏，交給 BackfillQueue 補抓
+        return [url for url in self.favorite_urls if url not in self.db_perm]
+
+    def _view_general(self):
+        # 最新的在前 (首頁與 /api/songs 共用同一個順序)
+        return sorted(self.db_general.values(), key=lambda x: x.discovered_at, reverse=True)
+
+    def _view_video(self):
+        return list(self.db_video.values())
+
+    def _view_piano(self):
+        # 1. Piano: 僅顯示標記為 is_piano_solo 的精選 (回歸 8 首經典)
+        return self.deduplicate_songs(self.known_songs(lambda pool: pool.piano_solo()))
+
+    def _view_followed(self):
+        # 2. Following: Only show songs by followed artists that were newly discovered in current feeds (New Arrivals + Video)
+        active_new = dict(self.db_general.items())
+        active_new.update(self.db_video.items())
+        raw_followed = [s for s in active_new.values() if self.is_followed(s.artist)]
+        return sorted(self.deduplicate_songs(raw_followed), key=lambda x: x.artist)
+
+    def _view_favorites(self):
+        # 3. Favorites (Saved): The permanent list of things you explicitly want to keep.
+        # 依收藏順序逐一查詢 (O(收藏數))，不再掃描所有歌曲
+        return self.deduplicate_songs([s for s in map(self.find_song, self.favorite_urls) if s is not None])
+
+class BackfillQueue:
+    """Favorites 元數據補抓佇列：去重、固定 worker 數、per-host 併發上限、失敗退避重試"""
+    WORKERS = int(os.environ.get("UFRET_BACKFILL_WORKERS", 2))
+    PER_HOST = int(os.environ.get("UFRET_BACKFILL_PER_HOST", 2))
+    RETRIES = int(os.environ.get("UFRET_BACKFILL_RETRIES", 3))
+    BACKOFF = float(os.environ.get("UFRET_BACKFILL_BACKOFF", 2))
+    FAIL_COOLDOWN = float(os.environ.get("UFRET_BACKFILL_FAIL_COOLDOWN", 3600))
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self._lock = threading.Lock()
+        self._pending = set()   # 已排隊 + 執行中 (in-flight)，同一 URL 不會重複抓
+        self._failed = {}       # url -> 放棄時間，冷卻期間不再排隊
+        self._queue = None
+        self._workers = []  # 保留 task 的參照 (event loop 只持有 weak reference)
+        self._hosts = {}
+
+    def enqueue(self, urls):
+        """Thread-safe：只排隊不等待，回傳實際新加入的數量"""
+        now = time.time()
+        with self._lock:
+            new = []
+            for url in urls:
+                if url in self._pending or now - self._failed.get(url, 0) < self.FAIL_COOLDOWN: continue
+                self._pending.add(url)
+                new.append(url)
+        if new: self.crawler.submit(self._put(new))
+        return len(new)
+
+    async def _put(self, urls):
+        # Queue 與 worker 必須在 runner 的 event loop 內建立
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.WORKERS)]
+        for url in urls: self._queue.put_nowait(url)
+
+    async def _worker(self):
+        while True:
+            url = await self._queue.get()
+            try: await self._process(url)
+            except Exception as e: console.print(f"[red]Backfill {url}: {e}[/red]")
+            finally:
+                with self._lock: self._pending.discard(url)
+
+    def _known(self, url):
+        with self.crawler.lock: return url in self.crawler.db_perm
+
+    def _save(self, url, song):
+        c = self.crawler
+        with c.mutate():
+            if url not in c.db_perm:
+                c.db_perm[url] = song
+                c.persist("perm")
+
+    async def _process(self, url):
+        c = self.crawler
+        host = urlsplit(url).netloc
+        sem = self._hosts.setdefault(host, asyncio.Semaphore(self.PER_HOST))
+        for attempt in range(self.RETRIES):
+            # c.lock 是 threading.RLock：在 worker thread 取得，不卡住 event loop
+            if await asyncio.to_thread(self._known, url): return
+            async with sem:
+                song = await c.fetch_song(url)
+            if song:
+                await asyncio.to_thread(self._save, url, song)
+                return
+            await asyncio.sleep(self.BACKOFF * 2 ** attempt)
+        with self._lock: self._failed[url] = time.time()
+        console.print(f"[red]Backfill gave up on {url} after {self.RETRIES} attempts[/red]")
+
+class SyncCoordinator:
+    """Single-flight sync：同一時間只跑一個 scrape_all，期間的請求 (Sync Now、排程) 都加入同一個 run；
+    上一次完成後 min_interval 秒內的請求直接回傳上一次的 run，不再重抓
+    """
+    MIN_INTERVAL = float(os.environ.get("UFRET_SYNC_MIN_INTERVAL", 60))
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self._lock = threading.Lock()
+        self._current = None  # 進行中的 run
+        self._last = None     # 最近一次結束的 run
+        self._futures = {}    # run id -> concurrent.futures.Future (只保留 current / last)
+        self._seq = 0
+
+    def request(self, source, min_interval=None, force=False):
+        """回傳 (run 狀態, started / joined / recent)"""
+        if min_interval is None: min_interval = self.MIN_INTERVAL
+        with self._lock:
+            if self._current is not None: return self.public(self._current), "joined"
+            last = self._last
+            if last is not None and last["status"] == "done" and time.time() - last["finished_at"] < min_interval:
+                return self.public(last), "recent"
+            self._seq += 1
+            run = {"id": f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{self._seq}", "status": "running", "source": source,
+                   "started_at": time.time(), "finished_at": None, "error": None}
+            self._current = run
+            # 只保留上一次與這一次的 future
+            self._futures = {k: f for k, f in self._futures.items() if last is not None and k == last["id"]}
+            self._futures[run["id"]] = self.crawler.submit(self._run(run, force))
+        console.print(f"[blue]Sync {run['id']} started ({source})[/blue]")
+        return self.public(run), "started"
+
+    async def _run(self, run, force):
+        try:
+            await self.crawler.scrape_all(force, run_id=run["id"])
+            run["status"] = "done"
+        except asyncio.CancelledError:
+            run["status"] = "cancelled"
+            raise
+        except Exception as e:
+            run["status"], run["error"] = "error", str(e) or type(e).__name__
+            console.print(f"[red]Sync {run['id']} failed: {run['error']}[/red]")
+        finally:
+            with self._lock:
+                run["finished_at"] = time.time()
+                self._current, self._last = None, run
+        return run["status"] == "done"
+
+    def wait(self, run_id, timeout=None):
+        """等待 run 結束；回傳是否成功 (逾時拋出 TimeoutError，run 繼續在背景完成)"""
+        with self._lock: future = self._futures.get(run_id)
+        if future is None: return self._last is not None and self._last["id"] == run_id and self._last["status"] == "done"
+        return future.result(timeout)
+
+    def status(self):
+        with self._lock:
+            return {"current": self.public(self._current), "last": self.public(self._last)}
+
+    @staticmethod
+    def public(run):
+        return None if run is None else dict(run)
 
 crawler = UfretCrawler()
+atexit.register(crawler.close)
+# 容器停止時送 SIGTERM：轉成正常結束，讓 atexit 把 write-behind 尚未寫出的資料寫完
+# (Gunicorn 等已自行處理 signal 的環境不覆蓋)
+if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+backfill = BackfillQueue(crawler)
+syncs = SyncCoordinator(crawler)
 
-def run_scrape_sync():
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(crawler.scrape_all())
-    loop.close()
+def run_scrape_sync(timeout=None, source="manual", min_interval=0):
+    """經過 SyncCoordinator 跑一次 sync 並等待 (已有 sync 在跑時等它結束)"""
+    run, _ = syncs.request(source, min_interval)
+    return syncs.wait(run["id"], timeout)
 
-def run_add_url_sync(url):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(crawler.add_url_manually(url))
-    loop.close()
+def run_add_url_sync(url, timeout=None):
+    return crawler.run(crawler.add_url_manually(url), timeout)
 
 def scheduler_thread():
     console.print("[bold blue]Scheduler thread started...[/bold blue]")
@@ -306,8 +834,10 @@ def scheduler_thread():
     # If it's already past 12:00 today and we haven't synced yet, do it now
     if now >= today_target and last_sync_date != today_str:
         console.print("[yellow]Detected missed sync for today. Catching up now...[/yellow]")
-        run_scrape_sync()
-        crawler.save_json(crawler.DB_LAST_SYNC, {"date": today_str})
+        # 失敗 / 取消時不記錄日期，下次啟動會再補跑
+        if run_scrape_sync(source="scheduler", min_interval=SyncCoordinator.MIN_INTERVAL):
+            crawler.save_json(crawler.DB_LAST_SYNC, {"date": today_str})
+        else: console.print("[red]Catch-up sync failed[/red]")
 
     while True:
         now = datetime.datetime.now()
@@ -320,15 +850,43 @@ def scheduler_thread():
         time.sleep(max(0, sleep_secs))
         
         console.print("[bold green]Starting scheduled daily sync...[/bold green]")
-        run_scrape_sync()
-        crawler.save_json(crawler.DB_LAST_SYNC, {"date": datetime.datetime.now().strftime("%Y-%m-%d")})
+        # 剛好有人按了 Sync Now (進行中或剛結束) 時直接併入那一次；SyncCoordinator 已記錄錯誤，這裡只看結果
+        if run_scrape_sync(source="scheduler", min_interval=SyncCoordinator.MIN_INTERVAL):
+            crawler.save_json(crawler.DB_LAST_SYNC, {"date": datetime.datetime.now().strftime("%Y-%m-%d")})
+        else: console.print("[red]Scheduled sync failed[/red]")
 
 # Start scheduler immediately on module load (ensures it runs under Gunicorn)
 if not hasattr(app, '_scheduler_started'):
     app._scheduler_started = True
     threading.Thread(target=scheduler_thread, daemon=True).start()
 
-HTML_TEMPLATE = """
+# 單張卡片：首頁的第一頁與 /api/songs 的後續分頁共用
+CARD_TEMPLATE = """
+        {% macro card_macro(s) %}
+        <div class="card {{ 'highlight' if highlight(s) else '' }}" data-url="{{ s.url }}" data-artist="{{ s.artist }}">
+            {% if s.is_piano %} <div class="card-tag tag-piano">PIANO</div> {% endif %}
+            {% if s.is_video %} <div class="card-tag tag-video">VIDEO</div> {% endif %}
+            
+            <a href="{{ s.url }}" class="title" target="_blank">{{ s.title }}</a>
+            <div class="artist">{{ s.artist }}</div>
+            
+            <div class="actions">
+                <!-- FOLLOW ARTIST = HEART (RED) -->
+                <button class="action-icon follow-icon {{ 'follow-active' if highlight(s) else '' }}" title="Follow Artist" onclick="toggleFollow(this)">
+                    {{ '♥' if highlight(s) else '♡' }}
+                </button>
+                
+                <!-- SAVE SONG = STAR (YELLOW) -->
+                <button class="action-icon save-icon {{ 'fav-active' if is_fav(s) else '' }}" title="Save Song" onclick="toggleSave(this)">
+                    {{ '★' if is_fav(s) else '☆' }}
+                </button>
+            </div>
+        </div>
+        {% endmacro %}
+"""
+CARDS_TEMPLATE = CARD_TEMPLATE + """{% for s in songs %} {{ card_macro(s) }} {% endfor %}"""
+
+HTML_TEMPLATE = CARD_TEMPLATE + """
 <!DOCTYPE html>
 <html lang="zh-Hant">
 <head>
@@ -589,7 +1147,7 @@ HTML_TEMPLATE = """
             <div class="mgmt-group">
                 <span class="mgmt-label">Add Song</span>
                 <input type="text" id="input-url" class="input-text" placeholder="Paste U-FRET URL here...">
-                <button class="btn-add" onclick="addUrl()">Import</button>
+                <button class="btn-add" onclick="addUrl(this)">Import</button>
             </div>
             <div class="mgmt-group">
                 <span class="mgmt-label">Add Artist</span>
@@ -599,81 +1157,235 @@ HTML_TEMPLATE = """
         </div>
 
         <div class="controls">
-            <button class="btn active" onclick="show('general', this)">New Arrivals <span style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ gen_count }}</span></button>
-            <button class="btn" onclick="show('video', this)">Videos <span style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ video_count }}</span></button>
-            <button class="btn" onclick="show('piano', this)">Piano <span style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ piano_count }}</span></button>
-            <button class="btn" onclick="show('followed', this)">Following <span style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ follow_count }}</span></button>
-            <button class="btn" onclick="show('favorites', this)">Saved <span style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ fav_count }}</span></button>
+            <button class="btn active" onclick="show('general', this)">New Arrivals <span id="count-general" style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ gen_count }}</span></button>
+            <button class="btn" onclick="show('video', this)">Videos <span id="count-video" style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ video_count }}</span></button>
+            <button class="btn" onclick="show('piano', this)">Piano <span id="count-piano" style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ piano_count }}</span></button>
+            <button class="btn" onclick="show('followed', this)">Following <span id="count-followed" style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ follow_count }}</span></button>
+            <button class="btn" onclick="show('favorites', this)">Saved <span id="count-favorites" style="opacity:0.6;font-size:0.9em;margin-left:4px;">{{ fav_count }}</span></button>
             <button class="btn btn-sync" onclick="sync()">Sync Now</button>
         </div>
         
-        {% macro card_macro(s) %}
-        <div class="card {{ 'highlight' if highlight(s) else '' }}">
-            {% if s.get('is_piano') %} <div class="card-tag tag-piano">PIANO</div> {% endif %}
-            {% if s.get('is_video') %} <div class="card-tag tag-video">VIDEO</div> {% endif %}
-            
-            <a href="{{ s.url }}" class="title" target="_blank">{{ s.title }}</a>
-            <div class="artist">{{ s.artist }}</div>
-            
-            <div class="actions">
-                <!-- FOLLOW ARTIST = HEART (RED) -->
-                <button class="action-icon {{ 'follow-active' if highlight(s) else '' }}" title="Follow Artist" onclick="toggle('follow', '{{ s.artist }}')">
-                    {{ '♥' if highlight(s) else '♡' }}
-                </button>
-                
-                <!-- SAVE SONG = STAR (YELLOW) -->
-                <button class="action-icon {{ 'fav-active' if is_fav(s) else '' }}" title="Save Song" onclick="toggle('favorite', '{{ s.url }}')">
-                    {{ '★' if is_fav(s) else '☆' }}
-                </button>
-            </div>
-        </div>
-        {% endmacro %}
 
-        <div id="sec-general" class="grid">{% for s in data.general %} {{ card_macro(s) }} {% endfor %}</div>
-        <div id="sec-video" class="grid" style="display:none;">{% for s in data.video %} {{ card_macro(s) }} {% endfor %}</div>
-        <div id="sec-piano" class="grid" style="display:none;">{% for s in data.piano %} {{ card_macro(s) }} {% endfor %}</div>
-        <div id="sec-followed" class="grid" style="display:none;">{% for s in data.followed %} {{ card_macro(s) }} {% endfor %}</div>
-        <div id="sec-favorites" class="grid" style="display:none;">{% for s in data.favorites %} {{ card_macro(s) }} {% endfor %}</div>
+        <!-- 只有 New Arrivals 的第一頁隨首頁送出；其餘分頁第一次點開時才向 /api/songs 取，捲到底再取下一頁 -->
+        <div id="sec-general" class="grid" data-loaded="1" data-cursor="{{ first_cursor or '' }}" data-done="{{ '0' if first_cursor else '1' }}">{% for s in first_page %} {{ card_macro(s) }} {% endfor %}</div>
+        <div id="sec-video" class="grid" style="display:none;"></div>
+        <div id="sec-piano" class="grid" style="display:none;"></div>
+        <div id="sec-followed" class="grid" style="display:none;"></div>
+        <div id="sec-favorites" class="grid" style="display:none;"></div>
+        <div id="more" style="height:1px;"></div>
     </div>
     
     <script>
+        const PAGE_SIZE = {{ page_size }};
+        let current = 'general';
+        const more = document.getElementById('more');
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(e => e.isIntersecting)) loadMore(current);
+        }, {rootMargin: '800px'});
+        observer.observe(more);
         function show(id, btn) {
             document.querySelectorAll('.btn').forEach(b => b.classList.remove('active'));
             btn.classList.add('active');
             document.querySelectorAll('.grid').forEach(g => g.style.display = 'none');
-            document.getElementById('sec-'+id).style.display = 'grid';
+            const sec = document.getElementById('sec-'+id);
+            sec.style.display = 'grid';
+            current = id;
+            if (sec.dataset.loaded !== '1') loadMore(id);
         }
-        async function toggle(type, val) {
-            await fetch('/api/'+type, {method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({value:val})});
-            location.reload();
+        async function loadMore(id) {
+            const sec = document.getElementById('sec-'+id);
+            if (sec.dataset.loading === '1' || sec.dataset.done === '1') return;
+            sec.dataset.loading = '1';
+            const q = new URLSearchParams({tab: id, limit: PAGE_SIZE});
+            if (sec.dataset.cursor) q.set('cursor', sec.dataset.cursor);
+            try {
+                const r = await fetch('/api/songs?' + q);
+                if (r.status === 409) {
+                    // 資料在捲動期間更新了：這個分頁從頭載入
+                    sec.innerHTML = ''; sec.dataset.cursor = ''; sec.dataset.loaded = '0';
+                    return;
+                }
+                const page = await r.json();
+                sec.insertAdjacentHTML('beforeend', page.html);
+                sec.dataset.cursor = page.next_cursor || '';
+                sec.dataset.done = page.next_cursor ? '0' : '1';
+                sec.dataset.loaded = '1';
+            } finally {
+                sec.dataset.loading = '0';
+                // 重新 observe 會立刻回報目前是否仍在畫面內 (一頁不夠填滿時繼續載入)
+                observer.unobserve(more); observer.observe(more);
+            }
+        }
+        // 操作只更新受影響的卡片與分頁計數，不重新載入整頁
+        async function post(path, body) {
+            const r = await fetch(path, {method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(body)});
+            return r.json();
+        }
+        function cardsWith(attr, value) {
+            return document.querySelectorAll(`.card[data-${attr}="${CSS.escape(value)}"]`);
+        }
+        function setCounts(counts) {
+            for (const [tab, n] of Object.entries(counts || {})) document.getElementById('count-'+tab).textContent = n;
+        }
+        function resetTab(id) {
+            // 內容整個變了的分頁：清空，目前正在看的話立刻重新載入
+            const sec = document.getElementById('sec-'+id);
+            sec.innerHTML = ''; sec.dataset.cursor = ''; sec.dataset.done = '0'; sec.dataset.loaded = '0';
+            if (id === current) loadMore(id);
+        }
+        function applySave(res) {
+            cardsWith('url', res.url).forEach(card => {
+                const icon = card.querySelector('.save-icon');
+                icon.classList.toggle('fav-active', res.saved);
+                icon.textContent = res.saved ? '★' : '☆';
+            });
+            const sec = document.getElementById('sec-favorites');
+            if (!res.saved) sec.querySelectorAll(`.card[data-url="${CSS.escape(res.url)}"]`).forEach(card => card.remove());
+            // 還沒捲到底的話新卡片會隨下一頁出現
+            else if (res.added && res.card && res.in_view && sec.dataset.done === '1') sec.insertAdjacentHTML('beforeend', res.card);
+            setCounts(res.counts);
+        }
+        function applyFollow(res) {
+            for (const [artist, on] of Object.entries(res.artists)) {
+                cardsWith('artist', artist).forEach(card => {
+                    card.classList.toggle('highlight', on);
+                    const icon = card.querySelector('.follow-icon');
+                    icon.classList.toggle('follow-active', on);
+                    icon.textContent = on ? '♥' : '♡';
+                });
+            }
+            resetTab('followed');
+            setCounts(res.counts);
+        }
+        async function toggleSave(btn) {
+            applySave(await post('/api/favorite', {value: btn.closest('.card').dataset.url}));
+        }
+        async function toggleFollow(btn) {
+            applyFollow(await post('/api/follow', {value: btn.closest('.card').dataset.artist}));
         }
         async function sync() {
             const btn = document.querySelector('.btn-sync');
             btn.innerText = "Syncing...";
             btn.style.opacity = 0.7;
-            await fetch('/api/sync', {method:'POST'});
-            setTimeout(() => location.reload(), 2000); 
+            const res = await (await fetch('/api/sync', {method:'POST'})).json();
+            // 沒有 EventSource 時退回舊做法
+            if (!window.EventSource) setTimeout(() => location.reload(), 2000);
+            else if (res.status === 'started' || res.status === 'joined') watchSync(res.event_id);
+            else {
+                // recent：上一次 sync 剛完成，這次不會再跑、也不會有事件，直接還原按鈕
+                btn.innerText = "Sync Now";
+                btn.style.opacity = 1;
+            }
         }
-        async function addUrl() {
-            const url = document.getElementById('input-url').value;
-            if(!url) return;
-            const btn = event.target; btn.innerText = "...";
-            await fetch('/api/add_url', {method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({url:url})});
-            location.reload();
+        // 同步進度與新歌由 /api/events 推送；串流只在 sync 進行中開啟 (done / error 即關閉，不長期佔住 worker)，
+        // 中途斷線時瀏覽器自動帶 Last-Event-ID 重連
+        let events = null;
+        function watchSync(since) {
+            if (events) return;
+            events = new EventSource(`/api/events?since=${since}`);
+            const btn = document.querySelector('.btn-sync');
+            let pages = 0;
+            events.addEventListener('sync', e => {
+                const d = JSON.parse(e.data);
+                if (d.state === 'started') { pages = 0; btn.innerText = "Syncing..."; btn.style.opacity = 0.7; return; }
+                events.close();
+                events = null;
+                btn.innerText = d.state === 'error' ? "Sync failed" : "Sync Now";
+                btn.style.opacity = 1;
+                if (d.state === 'done' && d.changed) {
+                    // 已載入的分頁從頭重新載入 (目前的分頁立刻載入，其餘等點開時)
+                    document.querySelectorAll('.grid').forEach(g => { if (g.dataset.loaded === '1') resetTab(g.id.slice(4)); });
+                    setCounts(d.counts);
+                }
+            });
+            events.addEventListener('page', () => { btn.innerText = `Syncing... (${++pages})`; });
+            events.addEventListener('songs', e => {
+                const d = JSON.parse(e.data);
+                btn.title = `${d.count} new: ` + d.songs.map(s => `${s.title} / ${s.artist}`).join(', ');
+            });
+            events.addEventListener('reset', () => location.reload());
+        }
+        // 開啟頁面時已有 sync (排程或其他分頁) 在跑：一樣顯示進度
+        if (window.EventSource) fetch('/api/sync').then(r => r.json()).then(s => { if (s.current) watchSync(s.event_id); });
+        async function addUrl(btn) {
+            const input = document.getElementById('input-url');
+            if(!input.value) return;
+            btn.innerText = "...";
+            const res = await post('/api/add_url', {url: input.value});
+            // pending：還在背景抓取，完成後下次載入即可看到
+            btn.innerText = {success: "Import", pending: "Queued"}[res.status] || "Failed";
+            if (res.status !== 'error') input.value = '';
+            if (res.status === 'success') applySave(res);
         }
         async function addArtist() {
-            const name = document.getElementById('input-artist').value;
-            if(!name) return;
-            await fetch('/api/follow', {method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({value:name})});
-            location.reload();
+            const input = document.getElementById('input-artist');
+            if(!input.value) return;
+            applyFollow(await post('/api/follow', {value: input.value}));
+            input.value = '';
         }
     </script>
 </body>
 </html>
 """
 
-def highlight(s): return any(f.lower() in s.get("artist","").lower() for f in crawler.followed_artists)
-def is_fav(s): return s["url"] in crawler.favorite_urls
+ADD_URL_TIMEOUT = float(os.environ.get("UFRET_ADD_URL_TIMEOUT", 20))
+
+class PageCache:
+    """index() 的 rendered HTML 快取：crawler.data_version 沒變就直接回傳同一份 bytes
+
+    壓縮版本 (gzip / br) 第一次被要求時才產生並一起快取；ETag 依內容雜湊 (重啟後仍有效)，
+    瀏覽器帶 If-None-Match 時回 304。
+    """
+    ENCODINGS = ("br", "gzip") if HAS_BROTLI else ("gzip",)
+    GZIP_LEVEL = int(os.environ.get("UFRET_PAGE_GZIP_LEVEL", 6))
+    BROTLI_QUALITY = int(os.environ.get("UFRET_PAGE_BROTLI_QUALITY", 5))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = None  # (data_version, etag, {encoding: body}, 待補抓的收藏)
+        self.stats = {"hits": 0, "renders": 0, "not_modified": 0}
+
+    def get(self, version, render):
+        """回傳 version 對應的快取；沒有時呼叫 render() -> (html, missing) 並存起來"""
+        entry = self._entry
+        if entry is not None and entry[0] == version:
+            self.stats["hits"] += 1
+            return entry
+        html, missing = render()
+        body = html.encode("utf-8")
+        entry = (version, hashlib.sha1(body).hexdigest()[:20], {"identity": body}, missing)
+        with self._lock:
+            self.stats["renders"] += 1
+            # render 期間資料又變了時不要蓋掉較新的版本
+            if self._entry is None or self._entry[0] <= version: self._entry = entry
+        return entry
+
+    def body(self, entry, encoding):
+        bodies = entry[2]
+        if encoding not in bodies:
+            raw = bodies["identity"]
+            bodies[encoding] = brotli.compress(raw, quality=self.BROTLI_QUALITY) if encoding == "br" else gzip.compress(raw, self.GZIP_LEVEL)
+        return bodies[encoding]
+
+    def response(self, entry):
+        encoding = request.accept_encodings.best_match(self.ENCODINGS) or "identity"
+        # 每種壓縮是不同的 representation，ETag 也要不同
+        etag = entry[1] if encoding == "identity" else f"{entry[1]}-{encoding}"
+        if etag in request.if_none_match:
+            self.stats["not_modified"] += 1
+            r = Response(status=304)
+        else:
+            r = Response(self.body(entry, encoding), mimetype="text/html")
+            if encoding != "identity": r.headers["Content-Encoding"] = encoding
+        r.set_etag(etag)
+        r.headers["Vary"] = "Accept-Encoding"
+        r.headers["Cache-Control"] = "no-cache"  # 每次都回來驗證 (資料隨時可能更新)
+        return r
+
+page_cache = PageCache()
+
+def highlight(s): return crawler.snapshot.matcher(s.artist)
+def is_fav(s): return s in crawler.snapshot.favorites
 
 @app.context_processor
 def utility_processor(): return dict(highlight=highlight, is_fav=is_fav)
@@ -681,62 +1393,153 @@ def utility_processor(): return dict(highlight=highlight, is_fav=is_fav)
 @app.route("/")
 def index():
     try:
+        snap = crawler.snapshot
+        entry = page_cache.get(snap.version, lambda: render_index(snap))
         # ASYNC CHECK: Trigger metadata fetching in background to avoid 502 timeout
-        with crawler.lock:
-            missing = [url for url in crawler.favorite_urls if url not in crawler.db_perm]
-        
-        if missing:
-            console.print(f"[yellow]Background fetching {len(missing)} favorites...[/yellow]")
-            for url in missing:
-                threading.Thread(target=run_add_url_sync, args=(url,), daemon=True).start()
-        
-        data = crawler.get_data_for_ui()
-        data["general"].sort(key=lambda x: x.get("discovered_at", ""), reverse=True)
-        return render_template_string(HTML_TEMPLATE, data=data, 
-                                     gen_count=len(data["general"]),
-                                     video_count=len(data["video"]),
-                                     piano_count=len(data["piano"]),
-                                     follow_count=len(data["followed"]),
-                                     fav_count=len(data["favorites"]))
+        # (enqueue 本身會略過進行中與冷卻中的 url，快取命中時也照樣重試)
+        if entry[3]:
+            queued = backfill.enqueue(entry[3])
+            if queued: console.print(f"[yellow]Background fetching {queued} favorites...[/yellow]")
+        return page_cache.response(entry)
     except Exception as e: return f"Error: {e}", 500
 
+def render_index(snap):
+    """依同一個 snapshot render 整頁 (不加鎖)，回傳 (html, 待補抓的收藏)"""
+    data = crawler.get_data_for_ui(snap)
+    first_page, first_cursor, _ = crawler.songs_page("general", snap=snap)
+    html = render_template_string(HTML_TEMPLATE, first_page=first_page, first_cursor=first_cursor,
+                                  highlight=lambda s: snap.matcher(s.artist), is_fav=lambda s: s in snap.favorites,
+                                  page_size=crawler.PAGE_SIZE,
+                                  gen_count=len(data["general"]),
+                                  video_count=len(data["video"]),
+                                  piano_count=len(data["piano"]),
+                                  follow_count=len(data["followed"]),
+                                  fav_count=len(data["favorites"]))
+    return html, list(snap.views["missing"])
+
+_cards_template = None
+
+def render_cards(songs, snap):
+    """/api/songs 的卡片 HTML (與首頁同一個 card_macro)；highlight / 收藏狀態取自同一個 snapshot，template 只編譯一次"""
+    global _cards_template
+    if _cards_template is None: _cards_template = app.jinja_env.from_string(CARDS_TEMPLATE)
+    return _cards_template.render(songs=songs, highlight=lambda s: snap.matcher(s.artist), is_fav=lambda s: s in snap.favorites)
+
+@app.route("/api/songs")
+def api_songs():
+    tab = request.args.get("tab", "general")
+    if tab not in crawler.VIEWS: return jsonify({"error": f"unknown tab: {tab}"}), 400
+    try: limit = min(max(int(request.args.get("limit", crawler.PAGE_SIZE)), 1), crawler.MAX_PAGE_SIZE)
+    except ValueError: return jsonify({"error": "limit must be an integer"}), 400
+    snap = crawler.snapshot
+    try: songs, next_cursor, total = crawler.songs_page(tab, request.args.get("cursor"), limit, snap)
+    except KeyError: return jsonify({"error": "stale cursor"}), 409
+    return jsonify({
+        "tab": tab, "total": total, "next_cursor": next_cursor, "version": snap.version,
+        "items": [{**s.to_dict(), "followed": snap.matcher(s.artist), "saved": s in snap.favorites} for s in songs],
+        "html": render_cards(songs, snap),
+    })
+
+EVENTS_KEEPALIVE = float(os.environ.get("UFRET_EVENTS_KEEPALIVE", 15))
+# 每條串流最多保持幾秒就結束 (不長期佔住 Gunicorn worker)，瀏覽器依 retry 帶 Last-Event-ID 重連，不會漏事件
+EVENTS_MAX_AGE = float(os.environ.get("UFRET_EVENTS_MAX_AGE", 25))
+
+@app.route("/api/events")
+def api_events():
+    """SSE：sync (started / done / error)、page (來源頁抓取完成)、songs (新歌)；reset 表示漏了事件，請整頁重新載入"""
+    bus = crawler.events
+    # 重連時瀏覽器帶 Last-Event-ID；第一次連線可用 ?since= 指定 (POST /api/sync 回傳的 event_id)，都沒有時只收之後的事件
+    last = request.headers.get("Last-Event-ID") or request.args.get("since", "")
+    last_id = int(last) if last.isdigit() else bus.last_id
+
+    def stream():
+        nonlocal last_id
+        # 先送出目前的 id：這段期間沒有事件就斷線時，重連也會帶上 Last-Event-ID
+        yield f"retry: 3000\nid: {last_id}\n\n"
+        deadline = time.monotonic() + EVENTS_MAX_AGE
+        while (left := deadline - time.monotonic()) > 0:
+            events, lost = bus.since(last_id, min(EVENTS_KEEPALIVE, left))
+            if lost:
+                last_id = max(bus.last_id, events[-1][0] if events else 0)
+                yield f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+                continue
+            if not events:
+                yield ": keepalive\n\n"  # 讓 proxy 不要因為閒置而斷線
+                continue
+            for event_id, kind, data in events:
+                yield f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                last_id = event_id
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route("/api/sync", methods=["POST"])
 def api_sync():
-    threading.Thread(target=run_scrape_sync).start()
-    return jsonify({"status": "started"})
+    # started：開始新的 run；joined：已有 sync 在跑；recent：上一次剛完成 (UFRET_SYNC_MIN_INTERVAL 內)
+    # event_id：前端以 /api/events?since=event_id 開啟串流，連線前發生的事件也會補送
+    event_id = crawler.events.last_id
+    run, status = syncs.request("api")
+    return jsonify({"status": status, "run": run, "event_id": event_id})
+
+@app.route("/api/sync", methods=["GET"])
+def api_sync_status():
+    return jsonify({**syncs.status(), "event_id": crawler.events.last_id})
+
+@app.route("/api/stats")
+def api_stats():
+    return jsonify({"http_cache": crawler.http_cache.stats, "page_cache": page_cache.stats})
+
+def save_patch(url, added):
+    """收藏狀態變動後前端要套用的部分更新：星號狀態、Saved 分頁要補上的卡片、各分頁計數
+
+    added：這次才加入收藏 (已收藏過的再匯入一次為 False，前端不會重複補上卡片)
+    """
+    snap = crawler.snapshot
+    pos = crawler.view_index("favorites", snap).get(url)
+    return {
+        "url": url, "saved": url in snap.favorites, "added": added, "in_view": pos is not None,
+        "card": render_cards([snap.views["favorites"][pos]], snap) if pos is not None else None,
+        "counts": crawler.view_counts(snap),
+    }
 
 @app.route("/api/follow", methods=["POST"])
 def api_follow():
     artist = request.json.get("value")
-    with crawler.lock:
-        c = crawler.load_txt(crawler.ARTISTS_FILE)
+    if not artist: return jsonify({"status": "error"}), 400
+    # 只改記憶體並標記 dirty，寫檔交給 flusher (連點多次只寫一次)
+    with crawler.mutate():
+        before = crawler.snapshot.matcher
+        c = list(crawler.followed_artists)
         if artist not in c: c.append(artist)
         else: c.remove(artist)
-        crawler.save_txt(crawler.ARTISTS_FILE, c)
         crawler.followed_artists = c
-    return jsonify({"status": "success"})
+        crawler.persist("followed_artists")
+    snap = crawler.snapshot
+    # 只回傳畫面上可能出現、且 highlight 狀態真的改變的歌手 (子字串比對，前端無法自行判斷)
+    artists = {s.artist for songs in crawler.get_data_for_ui(snap).values() for s in songs}
+    changed = {a: snap.matcher(a) for a in artists if before(a) != snap.matcher(a)}
+    return jsonify({"status": "success", "followed": artist in c, "artists": changed, "counts": crawler.view_counts(snap)})
 
 @app.route("/api/favorite", methods=["POST"])
 def api_favorite():
-    url = request.json.get("value")
-    with crawler.lock:
-        c = crawler.load_txt(crawler.FAVORITES_FILE)
-        if url not in c: c.append(url)
-        else: c.remove(url)
-        crawler.save_txt(crawler.FAVORITES_FILE, c)
+    url = canonical_url(request.json.get("value") or "")
+    if not url: return jsonify({"status": "error"}), 400
+    with crawler.mutate():
+        c = crawler.favorite_urls.copy()
+        added = c.toggle(url)
         crawler.favorite_urls = c
-    return jsonify({"status": "success"})
+        crawler.persist("favorites")
+    return jsonify({"status": "success", **save_patch(url, added)})
 
 @app.route("/api/add_url", methods=["POST"])
 def api_add_url():
     url = request.json.get("url")
-    if url: 
-        # For manual single import, we run synchronously so the user sees it immediately after reload
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(crawler.add_url_manually(url))
-        loop.close()
-    return jsonify({"status": "success"})
+    if not url: return jsonify({"status": "error"}), 400
+    # For manual single import, we wait (with timeout) so the user sees the card right away
+    try: result = run_add_url_sync(url, timeout=ADD_URL_TIMEOUT)
+    except TimeoutError: return jsonify({"status": "pending"})
+    if result is None: return jsonify({"status": "error"})
+    song, added = result
+    return jsonify({"status": "success", **save_patch(song.url, added)})
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
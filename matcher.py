@@ -0,0 +1,62 @@
+"""關注歌手比對：Aho–Corasick automaton，掃過一次歌手名稱就知道是否包含任一關注名稱 (與關注人數無關)"""
+import unicodedata
+from collections import deque
+
+
+def normalize(name):
+    """NFKC + casefold：全形 / 半形、大小寫視為相同"""
+    return unicodedata.normalize("NFKC", name).casefold()
+
+
+class ArtistMatcher:
+    """等同 any(f.lower() in artist.lower() for f in followed) 的子字串比對
+
+    建構 O(名稱總長)，比對 O(歌手名稱長度)；同一個歌手名稱的結果會快取 (關注清單變動時整個 matcher 重建)。
+    空字串不算關注名稱 (舊寫法下會讓所有歌曲都被標成關注)。
+    """
+    def __init__(self, names=()):
+        self.names = tuple(names)
+        self._cache = {}
+        # trie：goto[state] = {字元: 下一個 state}；out[state] 表示走到這裡 (或其 fail 鏈上) 已含某個名稱
+        goto, fail, out = [{}], [0], [False]
+        for name in self.names:
+            pattern = normalize(name)
+            if not pattern: continue
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    out.append(False)
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state] = True
+        # BFS 建 fail link (第一層固定指回 root)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]: f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] or out[fail[nxt]]
+        self._goto, self._fail, self._out = goto, fail, out
+        self._empty = len(goto) == 1
+
+    def search(self, text):
+        if self._empty: return False
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in normalize(text):
+            while state and ch not in goto[state]: state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]: return True
+        return False
+
+    def __call__(self, artist):
+        hit = self._cache.get(artist)
+        if hit is None: hit = self._cache[artist] = self.search(artist)
+        return hit
@@ -0,0 +1,127 @@
+"""歌曲資料模型：slotted Song 取代 dict，artist / tag / 日期字串 intern 化共用同一份記憶體"""
+import re
+import sys
+from dataclasses import dataclass, field
+
+SONG_ID_RE = re.compile(r"song\.php\?(?:[^#]*&)?data=(\d+)")
+SONG_URL = "https://www.ufret.jp/song.php?data={}"
+
+
+def parse_song_id(url):
+    """"https://www.ufret.jp/song.php?data=51026" -> 51026；不是歌曲連結時回傳 None"""
+    m = SONG_ID_RE.search(url)
+    return int(m.group(1)) if m else None
+
+
+def canonical_url(url, song_id=None):
+    """同一首歌的各種寫法 (http / https、手機版、多餘參數) -> SONG_URL；不是歌曲連結時只去掉前後空白"""
+    if song_id is None: song_id = parse_song_id(url)
+    return url.strip() if song_id is None else SONG_URL.format(song_id)
+
+
+@dataclass(slots=True)
+class Song:
+    title: str
+    artist: str
+    url: str
+    tags: tuple = ()
+    is_piano: bool = False
+    is_video: bool = False
+    is_piano_solo: bool = False
+    discovered_at: str = ""
+    song_id: int | None = field(default=None, compare=False)
+
+    def __post_init__(self):
+        # 同一位歌手 / 同一種 badge / 同一天在 db 裡會重複成千上萬次，intern 後只留一份
+        self.artist = sys.intern(self.artist)
+        self.tags = tuple(sys.intern(t) for t in self.tags)
+        self.discovered_at = sys.intern(self.discovered_at)
+        if self.song_id is None: self.song_id = parse_song_id(self.url)
+        # 所有 store 的 key 都是 canonical url (與 song id 一對一)；已是 canonical 時沿用原字串
+        url = canonical_url(self.url, self.song_id)
+        if url != self.url: self.url = url
+
+    @classmethod
+    def from_dict(cls, d):
+        """讀取既有 JSON 格式 (手動加入的舊資料沒有 is_piano_solo 欄位)"""
+        return cls(
+            d.get("title", "Unknown"), d.get("artist", "Unknown"), d["url"], d.get("tags") or (),
+            bool(d.get("is_piano")), bool(d.get("is_video")), bool(d.get("is_piano_solo")),
+            d.get("discovered_at", ""),
+        )
+
+    def to_dict(self):
+        """輸出與 v19.5.8 相同的 JSON 欄位 (song_id 由 url 推導，不落地)"""
+        return {
+            "title": self.title, "artist": self.artist, "url": self.url, "tags": list(self.tags),
+            "is_piano": self.is_piano, "is_video": self.is_video,
+            "is_piano_solo": self.is_piano_solo,
+            "discovered_at": self.discovered_at
+        }
+
+
+def to_jsonable(o):
+    """json.dump 的 default hook"""
+    if isinstance(o, Song): return o.to_dict()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def songs_from_json(d):
+    """{url: dict} -> {canonical url: Song}，略過缺少 url 等壞資料；同一首歌的多個 url 只留第一筆"""
+    out = {}
+    for url, s in d.items():
+        try: song = Song.from_dict({**s, "url": url})
+        except Exception: continue
+        out.setdefault(song.url, song)  # 與 key 共用同一個 url 字串
+    return out
+
+
+class Favorites:
+    """收藏清單：以 song id 為 key 的有序集合 (同一首歌的不同 url 只算一次)，依加入順序迭代 url
+
+    讀取端不加鎖：修改一律在 copy() 上做完再整個換上 (copy-on-write)。
+    """
+    __slots__ = ("_items",)
+
+    def __init__(self, urls=()):
+        self._items = {}  # key -> canonical url
+        for url in urls: self.add(url)
+
+    @staticmethod
+    def key(item):
+        """Song 或 url -> song id；不是歌曲連結時退回 url 本身"""
+        if isinstance(item, Song): return item.url if item.song_id is None else item.song_id
+        sid = parse_song_id(item)
+        return item.strip() if sid is None else sid
+
+    def add(self, url):
+        k = self.key(url)
+        if k in self._items: return False
+        self._items[k] = canonical_url(url)
+        return True
+
+    def discard(self, url):
+        return self._items.pop(self.key(url), None) is not None
+
+    def toggle(self, url):
+        """已收藏就移除、否則加入；回傳切換後是否為收藏"""
+        if self.discard(url): return False
+        self.add(url)
+        return True
+
+    def copy(self):
+        new = Favorites()
+        new._items = dict(self._items)
+        return new
+
+    def __contains__(self, item):
+        return self.key(item) in self._items
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f"Favorites({list(self._items.values())!r})"
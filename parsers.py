@@ -0,0 +1,266 @@
+"""HTML 解析層：列表頁歌曲項目 + 單曲頁 metadata，可切換 backend (lxml / html.parser)
+
+只解析需要的區塊 (region)：列表頁的 div.list-group、單曲頁的 <h1>，其餘 script / 廣告 / CSS 不進 tree。
+"""
+import os
+import re
+import datetime
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urljoin, urlsplit
+from bs4 import BeautifulSoup
+from rich.console import Console
+
+from models import Song
+
+try:
+    import lxml.etree
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+LISTING_SELECTOR = "div.list-group a.list-group-item"
+H1_RE = re.compile(r"<h1\b.*?</h1>", re.S | re.I)
+# class 屬性可能是雙引號、單引號或沒有引號
+LIST_GROUP_RE = re.compile(r"""<div\b[^>]*\bclass\s*=\s*["']?(?:[^"'>]*\s)?list-group(?=["'\s>])[^>]*>""", re.I)
+LISTING_ITEM_RE = re.compile(r"""<a\b[^>]*\bclass\s*=\s*["']?(?:[^"'>]*\s)?list-group-item(?=["'\s>])[^>]*>.*?</a>""", re.S | re.I)
+DIV_TAG_RE = re.compile(r"<(/?)div\b", re.I)
+
+console = Console()
+
+
+def listing_region(html, limit):
+    """切出所有 div.list-group 區塊，湊滿 limit 個項目就停；回傳 (slice, 是否已湊滿)
+
+    slice 可能停在某個 </a> 之後、div 尚未關閉，交給 parser 自動補齊即可。
+    """
+    parts, count, pos = [], 0, 0
+    for m in LIST_GROUP_RE.finditer(html):
+        if m.start() < pos: continue  # 巢狀的 list-group 已包含在上一個區塊內
+        depth, end = 0, len(html)
+        for t in DIV_TAG_RE.finditer(html, m.start()):
+            depth += -1 if t.group(1) else 1
+            if depth == 0:
+                end = html.find(">", t.end()) + 1 or len(html)
+                break
+        for item in LISTING_ITEM_RE.finditer(html, m.start(), end):
+            count += 1
+            if count >= limit:
+                parts.append(html[m.start():item.end()])
+                return "".join(parts), True
+        parts.append(html[m.start():end])
+        pos = end
+    return "".join(parts), False
+
+
+def scoped_listing(html, limit):
+    """listing_region 的 slice；切不出 div.list-group 時 (markup 改版) 警告並回傳 None，由呼叫端改解析整份文件"""
+    region = listing_region(html, limit)[0]
+    if region: return region
+    if html.strip(): console.print("[yellow]No div.list-group region found, parsing the full document[/yellow]")
+    return None
+
+
+def song_region(html):
+    """單曲頁只需要 <h1> (標題、歌手、badge)；找不到完整的 </h1> 時回傳 None"""
+    m = H1_RE.search(html)
+    return m.group() if m else None
+
+
+# 標題中要剔除的裝飾字 (badge 文字、日期)
+TITLE_NOISE_RE = re.compile(r"(U-リク|NEW|追加|初心者|動画プラス|ピアノソロ|ソロ|初級|\d{4}/\d{2}/\d{2})")
+# 不可能是標題的文字節點
+NON_TITLE_PARTS = frozenset(("U-リク", "-"))
+
+# backend 抽出的原始欄位：texts 為連結內所有文字節點 (未 strip，只走一次)
+RawItem = namedtuple("RawItem", "href badges artist texts strong")
+
+
+def today():
+    return datetime.date.today().isoformat()
+
+
+@lru_cache(maxsize=32)
+def _origin(base_url):
+    p = urlsplit(base_url)
+    return f"{p.scheme}://{p.netloc}"
+
+
+def join_url(base_url, href):
+    """列表頁的 href 幾乎都是 "/song.php?data=..."：直接接上 origin，其餘交給 urljoin"""
+    if href.startswith("/") and not href.startswith("//") and "/." not in href: return _origin(base_url) + href
+    return urljoin(base_url, href)
+
+
+def build_song(raw, base_url, discovered_at=None):
+    """由 RawItem 組出 Song (所有 backend 共用，保證輸出一致)"""
+    href = raw.href
+    if "song.php?data=" not in href: return None # 關鍵：排除非歌曲連結（如導覽鈕）
+    badges = raw.badges
+
+    # Robust Artist Parsing
+    if raw.artist is not None:
+        artist = raw.artist.strip()
+        if artist.startswith("-"): artist = artist[1:].strip()
+    else:
+        # Try parsing from "Title - Artist" format (common on pickup pages)
+        clean_raw = "".join(raw.texts).strip()
+        artist = clean_raw.rpartition(" - ")[2].strip() if " - " in clean_raw else "Unknown"
+
+    # 2. 解析標題 (Title) - 優先讀取 <strong> 標籤 (針對 Piano Solo 頁面結構)
+    if raw.strong is not None:
+        raw_title = raw.strong.strip()
+    else:
+        raw_title = "Unknown"
+        for p in raw.texts:
+            p = p.strip()
+            if p and p != artist and p not in NON_TITLE_PARTS and p not in badges and "追加" not in p and "NEW" not in p:
+                raw_title = p
+                break
+
+    # 3. 如果標題內還殘留歌手（由連字號切分），再次清理
+    if " - " in raw_title: raw_title = raw_title.partition(" - ")[0].strip()
+
+    title = TITLE_NOISE_RE.sub("", raw_title).strip().lstrip("-").strip() or "Unknown Song"
+
+    return Song(
+        title, artist, join_url(base_url, href), badges,
+        any("ピアノ" in t for t in badges), any("動画" in t for t in badges),
+        False, # v19.5.7: 預設 False，僅精選區設為 True
+        discovered_at or today(),
+    )
+
+
+def song_meta(title, artist, badges):
+    return {"title": title, "artist": artist, "tags": badges,
+            "is_piano": any("ピアノ" in t for t in badges),
+            "is_video": any("動画" in t for t in badges)}
+
+
+def _is_artist_style(s):
+    return s is not None and ("font-size:12px" in s or "font-size: 12px" in s)
+
+
+class SoupParser:
+    """BeautifulSoup + html.parser：最慢但零額外依賴，作為 fallback"""
+    name = "html.parser"
+
+    def extract(self, item):
+        link_tag = item if item.name == "a" else item.find("a")
+        if not link_tag: return None
+        # 一次走完所有 span：同時收集 badge 與第一個歌手 span
+        badges, artist_tag = [], None
+        for span in item.find_all("span"):
+            if "badge" in (span.get("class") or ()): badges.append(span.get_text().strip())
+            if artist_tag is None and _is_artist_style(span.get("style")): artist_tag = span
+        strong_tag = link_tag.find("strong")
+        return RawItem(
+            link_tag.get("href", ""),
+            badges,
+            artist_tag.get_text() if artist_tag else None,
+            list(link_tag.strings),
+            strong_tag.get_text() if strong_tag else None,
+        )
+
+    def parse_item(self, item, base_url, discovered_at=None):
+        try:
+            raw = self.extract(item)
+            return build_song(raw, base_url, discovered_at) if raw else None
+        except: return None
+
+    def listing(self, html, base_url, limit, scoped=True):
+        if scoped: html = scoped_listing(html, limit) or html
+        items = BeautifulSoup(html, "html.parser").select(LISTING_SELECTOR)[:limit]
+        d = today()
+        return [s for s in (self.parse_item(item, base_url, d) for item in items) if s]
+
+    def song_page(self, html, scoped=True):
+        region = song_region(html) if scoped else None
+        soup = BeautifulSoup(region or html, "html.parser")
+        h1 = soup.select_one("h1")
+        if h1:
+            t_span = h1.find("span", style=lambda s: s and "font-weight:bold" in s)
+            title = t_span.get_text().strip() if t_span else (h1.find(string=True, recursive=False) or "").strip()
+            a_span = h1.find("span", style=lambda s: s and "font-size" in s)
+            artist = a_span.get_text().strip() if a_span else "Unknown"
+        else:
+            title, artist = "Unknown", "Unknown"
+        return song_meta(title, artist, [t.text.strip() for t in soup.select("span.badge")])
+
+
+def _has_class(cls):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+
+class LxmlParser:
+    """lxml.html 直接走 C 實作的 tree + XPath，不經過 BeautifulSoup 物件層"""
+    name = "lxml"
+    if HAS_LXML:
+        ITEMS_XPATH = lxml.etree.XPath(f"//div[{_has_class('list-group')}]//a[{_has_class('list-group-item')}]")
+        BADGE_XPATH = lxml.etree.XPath(f".//span[{_has_class('badge')}]")
+
+    @staticmethod
+    def _first_span(el, needles):
+        for span in el.iter("span"):
+            style = span.get("style")
+            if style and any(n in style for n in needles): return span
+        return None
+
+    def extract(self, a):
+        # 一次走完所有 span：同時收集 badge 與第一個歌手 span
+        badges, artist_tag = [], None
+        for span in a.iter("span"):
+            cls = span.get("class")
+            if cls and "badge" in cls.split(): badges.append(span.text_content().strip())
+            if artist_tag is None and _is_artist_style(span.get("style")): artist_tag = span
+        strong_tag = next(a.iter("strong"), None)
+        return RawItem(
+            a.get("href", ""),
+            badges,
+            artist_tag.text_content() if artist_tag is not None else None,
+            list(a.itertext()),
+            strong_tag.text_content() if strong_tag is not None else None,
+        )
+
+    def parse_item(self, a, base_url, discovered_at=None):
+        try: return build_song(self.extract(a), base_url, discovered_at)
+        except: return None
+
+    def listing(self, html, base_url, limit, scoped=True):
+        region = scoped_listing(html, limit) if scoped else None
+        if region: root = lxml.html.fragment_fromstring(region, create_parent="div")
+        elif html.strip(): root = lxml.html.fromstring(html)
+        else: return []
+        items = self.ITEMS_XPATH(root)[:limit]
+        d = today()
+        return [s for s in (self.parse_item(a, base_url, d) for a in items) if s]
+
+    def song_page(self, html, scoped=True):
+        # libxml2 遇到 <h1><p> 會提早關閉 h1，改把原始 <h1>...</h1> 片段包進 div 另外解析，
+        # 讓 h1 原本的內容 (含被擠出去的兄弟節點) 全部落在 wrapper 裡
+        region = song_region(html)
+        if region:
+            wrapper = lxml.html.fragment_fromstring(region, create_parent="div")
+            h1 = wrapper[0]
+            # 等同 BeautifulSoup 的 find(string=True, recursive=False)：原始 h1 第一段直屬文字
+            direct = [h1.text] + [c.tail for c in h1] + [c.tail for c in wrapper]
+            t_span = self._first_span(wrapper, ("font-weight:bold",))
+            title = t_span.text_content().strip() if t_span is not None else next((t for t in direct if t is not None), "").strip()
+            a_span = self._first_span(wrapper, ("font-size",))
+            artist = a_span.text_content().strip() if a_span is not None else "Unknown"
+        else:
+            title, artist = "Unknown", "Unknown"
+        # scoped：badge 只取 h1 內 (歌曲本身的標籤)，不含側欄等整頁雜訊
+        scope = wrapper if scoped and region else lxml.html.fromstring(html)
+        return song_meta(title, artist, [t.text_content().strip() for t in self.BADGE_XPATH(scope)])
+
+
+PARSERS = {"html.parser": SoupParser}
+if HAS_LXML: PARSERS["lxml"] = LxmlParser
+
+
+def get_parser(name=None):
+    """UFRET_PARSER 指定 backend；預設優先 lxml，未安裝時退回 html.parser"""
+    name = name or os.environ.get("UFRET_PARSER") or ("lxml" if HAS_LXML else "html.parser")
+    return PARSERS.get(name, SoupParser)()
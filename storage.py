@@ -0,0 +1,932 @@
+"""資料儲存層：crawler 的三個 pool (general / video / perm) 與兩份清單 (favorites / followed_artists)
+
+- json   (預設)：沿用 data/*.json + *.txt；perm 以 mmap + offset index 延遲載入，其餘整份在記憶體；
+  flush 時只 append 變動到 journal，定期 compact 才整檔重寫 (temp + fsync + rename，crash 不會留下截斷的檔案)；
+  JSON codec 可選 orjson / msgspec (UFRET_JSON_CODEC)，格式可選 pretty / compact (UFRET_JSON_FORMAT)
+- sqlite (UFRET_STORAGE=sqlite)：data/ufret.db (WAL)，row-level upsert + 索引查詢；
+  第一次開啟時自動從既有的 JSON / txt 搬移一次
+"""
+import os
+import json
+import sqlite3
+import mmap
+import struct
+import hashlib
+import tempfile
+import threading
+import time
+from collections.abc import MutableMapping
+
+from models import SONG_URL, Song, canonical_url, parse_song_id, songs_from_json, to_jsonable
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import msgspec
+    HAS_MSGSPEC = True
+except ImportError:
+    HAS_MSGSPEC = False
+
+
+class StdlibCodec:
+    """標準庫 json：pretty 輸出與 v19.5.8 的 json.dump(indent=2, ensure_ascii=False) 完全相同"""
+    name = "json"
+
+    def loads(self, raw):
+        return json.loads(raw)
+
+    def dumps(self, d, pretty=False):
+        if pretty: return json.dumps(d, ensure_ascii=False, indent=2, default=to_jsonable).encode("utf-8")
+        return json.dumps(d, ensure_ascii=False, separators=(",", ":"), default=to_jsonable).encode("utf-8")
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def loads(self, raw):
+        return orjson.loads(raw)
+
+    def dumps(self, d, pretty=False):
+        # Song 是 dataclass：passthrough 給 to_jsonable，維持 to_dict() 的欄位 (不輸出 song_id)
+        option = orjson.OPT_PASSTHROUGH_DATACLASS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(d, default=to_jsonable, option=option)
+
+
+class MsgspecCodec:
+    name = "msgspec"
+
+    def __init__(self):
+        self.encoder = msgspec.json.Encoder()
+
+    def loads(self, raw):
+        return msgspec.json.decode(raw)
+
+    def dumps(self, d, pretty=False):
+        # msgspec 會直接序列化 dataclass 的所有欄位，先把 {url: Song} 轉成 to_dict()
+        if isinstance(d, dict): d = {k: v.to_dict() if isinstance(v, Song) else v for k, v in d.items()}
+        raw = self.encoder.encode(d)
+        return msgspec.json.format(raw, indent=2) if pretty else raw
+
+
+CODECS = {"json": StdlibCodec}
+if HAS_MSGSPEC: CODECS["msgspec"] = MsgspecCodec
+if HAS_ORJSON: CODECS["orjson"] = OrjsonCodec
+
+
+def get_codec(name=None):
+    """UFRET_JSON_CODEC 指定；預設優先 orjson，其次 msgspec，都沒有時用標準庫"""
+    name = name or os.environ.get("UFRET_JSON_CODEC") or ("orjson" if HAS_ORJSON else "msgspec" if HAS_MSGSPEC else "json")
+    return CODECS.get(name, StdlibCodec)()
+
+
+CODEC = get_codec()
+# auto：沿用既有檔案的格式 (新檔案為 pretty，與舊版相同)；compact / pretty：一律改寫成該格式
+JSON_FORMAT = os.environ.get("UFRET_JSON_FORMAT", "auto")
+
+
+def is_pretty(raw):
+    """縮排格式的檔案以 "{\n" 開頭；"{}" 等無法判斷的視為 pretty"""
+    return raw[1:2] in (b"\n", b"\r", b"}", b"")
+
+
+def wants_pretty(fn):
+    if JSON_FORMAT != "auto": return JSON_FORMAT != "compact"
+    try:
+        with open(fn, "rb") as f: return is_pretty(f.read(2))
+    except OSError: return True
+
+
+def _fsync_dir(d):
+    # rename 本身也要落地；Windows 不支援對目錄 fsync，略過即可
+    try:
+        fd = os.open(d, os.O_RDONLY)
+        try: os.fsync(fd)
+        finally: os.close(fd)
+    except OSError: pass
+
+
+def atomic_write(fn, data):
+    """寫到同目錄的 temp 檔 → fsync → os.replace：中途 crash 只會看到舊檔或新檔"""
+    d = os.path.dirname(fn) or "."
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(fn) + ".", suffix=".tmp", dir=d)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, os.stat(fn).st_mode if os.path.exists(fn) else 0o644)
+        os.replace(tmp, fn)
+    except:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+    _fsync_dir(d)
+
+
+def append_lines(fn, lines):
+    with open(fn, "ab") as f:
+        f.write(b"".join(l + b"\n" for l in lines))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def dump_json(d, pretty=True):
+    return CODEC.dumps(d, pretty)
+
+
+def load_txt(fn):
+    if not os.path.exists(fn): return []
+    try:
+        with open(fn, "r", encoding="utf-8") as f: return [l.strip() for l in f if l.strip() and not l.startswith("#")]
+    except: return []
+
+
+def save_txt(fn, d):
+    try:
+        atomic_write(fn, ("\n".join(d)+"\n").encode("utf-8"))
+        return True
+    except: return False
+
+
+def load_json(fn):
+    if not os.path.exists(fn): return {}
+    try:
+        with open(fn, "rb") as f: return CODEC.loads(f.read())
+    except: return {}
+
+
+def save_json(fn, d):
+    try:
+        atomic_write(fn, dump_json(d, wants_pretty(fn)))
+        return True
+    except: return False
+
+
+def run_steps(step):
+    """同步執行分段 writer (見 WriteBehind)：依序呼叫直到結果不再是 callable；回傳是否成功"""
+    while callable(step): step = step()
+    return step is not False
+
+
+def stage_write(fn, raw):
+    """分段 writer 的寫檔步驟：bytes 已在鎖內準備好，回傳在鎖外執行的 atomic_write"""
+    def write():
+        try: atomic_write(fn, raw)
+        except: return False
+        return True
+    return write
+
+
+def stage_json(fn, d):
+    """鎖內序列化，寫檔留給鎖外"""
+    return stage_write(fn, dump_json(d, wants_pretty(fn)))
+
+
+def stage_txt(fn, d):
+    return stage_write(fn, ("\n".join(d)+"\n").encode("utf-8"))
+
+
+def is_noise(url, s):
+    """Unknown 歌手或非歌曲連結 (sanitize 用)"""
+    return s.artist == "Unknown" or "song.php?data=" not in url
+
+
+class Journal:
+    """JSON snapshot ({url: song}，格式不變) + append-only journal (path + ".journal") 的共用邏輯
+
+    journal 第一行記錄它所依附的 snapshot 雜湊，其後每行一筆 {"url", "song"} (song 為 null 表示刪除)。
+    flush() 只 append 這次變動的 url；replace() 或累積 COMPACT_EVERY 筆後才 compact：
+    先原子寫入新 snapshot 再刪 journal，兩步之間 crash 時舊 journal 的雜湊對不上，載入時直接捨棄。
+    子類別提供 _apply(url, song) (不記錄變動) 與 _stage_snapshot()：鎖內複製要寫的內容，回傳鎖外的
+    寫檔函式 (序列化、fsync)，寫檔函式再回傳鎖內的 install() (換上新 snapshot，回傳它的雜湊)。
+    flush_steps() / compact_steps() 是給 WriteBehind 的分段 writer，鎖外寫檔期間的變動留在 _changes 等下一次 flush。
+    """
+    COMPACT_EVERY = int(os.environ.get("UFRET_JOURNAL_COMPACT_EVERY", 500))
+
+    def _init_journal(self, path):
+        self.path = path
+        self.journal = path + ".journal"
+        self._changes = []   # 依序的 (url, Song)，None 表示刪除 (不合併：刪除後再加入要保留先後)
+        self._rewrite = False
+        self._base = None
+        self._journaled = 0
+
+    def _read_snapshot(self):
+        """讀取整份 snapshot 並記下雜湊；壞檔移到 *.corrupt 並要求 compact"""
+        try:
+            with open(self.path, "rb") as f: raw = f.read()
+        except OSError: raw = b""
+        self._base = hashlib.sha1(raw).hexdigest()
+        if not raw: return {}
+        try: return CODEC.loads(raw)
+        except Exception:
+            # 舊版非原子寫入留下的截斷檔：移到旁邊保留現場，不要被下一次 compact 蓋掉
+            try: os.replace(self.path, self.path + ".corrupt")
+            except OSError: pass
+            self._rewrite = True
+            return {}
+
+    def _replay(self):
+        """套用 journal；回傳 (筆數, 是否需要立刻 compact)"""
+        try:
+            with open(self.journal, "rb") as f: lines = f.read().split(b"\n")
+        except OSError: return 0, False
+        try: base = CODEC.loads(lines[0]).get("base")
+        except Exception: return 0, True
+        if base != self._base: return 0, True  # compact 中斷留下的舊 journal
+        n = 0
+        for line in lines[1:]:
+            if not line: continue
+            try:
+                e = CODEC.loads(line)
+                url, song = canonical_url(e["url"]), e["song"]  # 舊版 journal 可能是非 canonical 的 url
+                self._apply(url, None if song is None else Song.from_dict({**song, "url": url}))
+            except Exception: return n, True  # 尾端寫到一半
+            n += 1
+        return n, False
+
+    def _open_journal(self):
+        self._journaled, stale = self._replay()
+        if stale or self._rewrite: self.compact()
+
+    def flush(self):
+        return run_steps(self.flush_steps())
+
+    def compact(self):
+        """整份重寫 snapshot 並清掉 journal"""
+        return run_steps(self.compact_steps())
+
+    def flush_steps(self):
+        if self._rewrite or self._journaled + len(self._changes) > self.COMPACT_EVERY: return self.compact_steps()
+        if not self._changes: return True
+        n = len(self._changes)
+        lines = [] if os.path.exists(self.journal) else [CODEC.dumps({"base": self._base})]
+        lines += [CODEC.dumps({"url": url, "song": s.to_dict() if s else None}) for url, s in self._changes]
+
+        def write():
+            try: append_lines(self.journal, lines)
+            except: return False
+            return lambda: self._journal_done(n)
+        return write
+
+    def _journal_done(self, n):
+        self._journaled += n
+        del self._changes[:n]
+        return True
+
+    def compact_steps(self):
+        n = len(self._changes)
+        write = self._stage_snapshot()
+        self._rewrite = False  # 寫檔期間的 replace() 會再設回 True
+
+        def io():
+            try:
+                install = write()
+                if os.path.exists(self.journal): os.remove(self.journal)
+            except: return self._compact_failed
+            return lambda: self._compact_done(n, install)
+        return io
+
+    def _compact_done(self, n, install):
+        try: self._base = install()
+        except: return self._compact_failed()
+        self._journaled = 0
+        del self._changes[:n]
+        return True
+
+    def _compact_failed(self):
+        self._rewrite = True
+        return False
+
+
+class JsonPool(Journal, dict):
+    """整份載入記憶體的 pool (general / video，或 UFRET_LAZY_PERM=0 時的 perm)"""
+    def __init__(self, path):
+        super().__init__()
+        self._init_journal(path)
+        raw = self._read_snapshot()
+        songs = songs_from_json(raw)
+        # 舊資料的 key 不是 canonical url (或同一首歌有多個 url)：合併後的結果立刻 compact 寫回
+        if songs.keys() != raw.keys(): self._rewrite = True
+        dict.update(self, songs)
+        self._open_journal()
+
+    def _apply(self, url, s):
+        if s is None: dict.pop(self, url, None)
+        else: dict.__setitem__(self, url, s)
+
+    def _stage_snapshot(self):
+        songs = dict(self)  # Song 放進 pool 後不會被原地修改：鎖內只複製 dict，序列化與寫檔都在鎖外
+
+        def write():
+            raw = dump_json(songs, wants_pretty(self.path))
+            atomic_write(self.path, raw)
+            sha = hashlib.sha1(raw).hexdigest()
+            return lambda: sha
+        return write
+
+    def __setitem__(self, url, s):
+        dict.__setitem__(self, url, s)
+        self._changes.append((url, s))
+
+    def __delitem__(self, url):
+        dict.__delitem__(self, url)
+        self._changes.append((url, None))
+
+    def pop(self, url, *default):
+        if url in self: self._changes.append((url, None))
+        return dict.pop(self, url, *default)
+
+    def update(self, *a, **kw):
+        self._rewrite = True
+        dict.update(self, *a, **kw)
+
+    def clear(self):
+        self._rewrite = True
+        dict.clear(self)
+
+    def replace(self, songs):
+        self.clear()
+        self.update(songs)
+
+    def piano_solo(self):
+        return [s for s in self.values() if s.is_piano_solo]
+
+    def sanitize(self):
+        bad = [url for url, s in self.items() if is_noise(url, s)]
+        for url in bad: del self[url]
+        return len(bad)
+
+
+class LazyJsonPool(Journal, MutableMapping):
+    """mmap 的 snapshot + 依 song id 排序的 offset index (path + ".idx")：啟動 O(1)，只有被讀到的歌曲才會變成 Song
+
+    snapshot 仍是同一份 {url: song} JSON (可直接換回 JsonPool)；index 在 compact 時一併寫出：
+      header   magic、snapshot 大小 / mtime_ns / sha1、筆數、extras 長度、是否 pretty
+      extras   JSON：piano (is_piano_solo 的 slot)、noise (sanitize 要刪的 slot)、noid (無 song id 的 url -> slot)
+      records  (song_id, key 位移, key 長度, value 位移, value 長度, 檔內順序) × n，依 (song_id, 順序) 排序
+    index 與 snapshot 的大小 / mtime 對不上 (例如舊版寫的檔、compact 中斷) 時整份載入一次並重建。
+    UFRETIX2 起 snapshot 的 key 一律是 canonical url；UFRETIX1 的 index 視為失效 (重建時順便搬移舊 key)。
+    變動先放在 overlay (_changed / _added / _deleted) 並照常寫 journal，compact 時才合併回 snapshot。
+    """
+    MAGIC = b"UFRETIX2"
+    HEADER = struct.Struct("<8sQQ40sIIB")
+    RECORD = struct.Struct("<QQIQII")
+
+    def __init__(self, path):
+        self._init_journal(path)
+        self.index_path = path + ".idx"
+        self._mm = self._idx = None
+        self._n = 0
+        self._extras = {"piano": [], "noise": [], "noid": {}}
+        self._changed = {}   # snapshot 內的 url -> 新 Song
+        self._added = {}     # snapshot 外的新 url -> Song (依加入順序)
+        self._deleted = set()
+        self._replaced = 0  # replace() 次數：compact 寫檔期間被整份換掉時，install 要沿用新的內容
+        if not self._open_index():
+            # 沒有可用的 index：整份載入一次放進 overlay，compact 後即改為 mmap
+            self._added = songs_from_json(self._read_snapshot())
+            self._rewrite = True
+        self._open_journal()
+
+    # --- index / mmap ---
+    def _open_index(self):
+        try:
+            st = os.stat(self.path)
+            with open(self.index_path, "rb") as f: idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError): return False
+        magic, size, mtime_ns, sha, n, extras_len, pretty = self.HEADER.unpack_from(idx, 0)
+        if magic != self.MAGIC or size != st.st_size or mtime_ns != st.st_mtime_ns:
+            idx.close()
+            return False
+        start = self.HEADER.size + extras_len
+        if len(idx) != start + n * self.RECORD.size:
+            idx.close()
+            return False
+        self._extras = CODEC.loads(idx[self.HEADER.size:start])
+        self._records_at, self._n, self._pretty, self._base = start, n, bool(pretty), sha.decode()
+        self._idx = idx
+        if size:
+            with open(self.path, "rb") as f: self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+
+    def _close_maps(self):
+        for m in (self._mm, self._idx):
+            if m is not None: m.close()
+        self._mm = self._idx = None
+
+    def close(self):
+        self._close_maps()
+
+    def _rec(self, slot):
+        return self.RECORD.unpack_from(self._idx, self._records_at + slot * self.RECORD.size)
+
+    def _key(self, rec):
+        return CODEC.loads(self._mm[rec[1]:rec[1] + rec[2]])
+
+    def _song(self, url, rec):
+        return Song.from_dict({**CODEC.loads(self._mm[rec[3]:rec[3] + rec[4]]), "url": url})
+
+    def _find(self, url):
+        """url 在 snapshot 內的 record (不論是否已刪除)；找不到回傳 None"""
+        if not self._n: return None
+        sid = parse_song_id(url)
+        if sid is None:
+            slot = self._extras["noid"].get(url)
+            return None if slot is None else self._rec(slot)
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._rec(mid)[0] < sid: lo = mid + 1
+            else: hi = mid
+        while lo < self._n:
+            rec = self._rec(lo)
+            if rec[0] != sid: break
+            if self._key(rec) == url: return rec
+            lo += 1
+        return None
+
+    def _base_records(self):
+        """snapshot 內所有 (slot, record)，依檔內順序"""
+        return sorted(((i, self._rec(i)) for i in range(self._n)), key=lambda r: r[1][5])
+
+    # --- overlay ---
+    def _get(self, url):
+        """回傳 (url, Song, 檔內順序) 或 None；順序為 None 表示是新加入的"""
+        if url in self._added: return url, self._added[url], None
+        if url in self._deleted: return None
+        rec = self._find(url)
+        if rec is None: return None
+        return url, self._changed.get(url) or self._song(url, rec), rec[5]
+
+    def _apply(self, url, s):
+        """套用一筆變動 (None = 刪除)，不寫 journal；回傳 url 原本是否存在"""
+        if s is None:
+            if self._added.pop(url, None) is not None: return True
+            if url in self._deleted or self._find(url) is None: return False
+            self._deleted.add(url)
+            self._changed.pop(url, None)
+            return True
+        if url in self._added or url in self._deleted or self._find(url) is None:
+            # 與 dict 相同：新 url (含刪除後再加入的) 排在最後
+            self._added[url] = s
+        else:
+            self._changed[url] = s
+        return True
+
+    def __getitem__(self, url):
+        hit = self._get(url)
+        if hit is None: raise KeyError(url)
+        return hit[1]
+
+    def __contains__(self, url):
+        return self._get(url) is not None
+
+    def __setitem__(self, url, s):
+        self._apply(url, s)
+        self._changes.append((url, s))
+
+    def __delitem__(self, url):
+        if not self._apply(url, None): raise KeyError(url)
+        self._changes.append((url, None))
+
+    def __len__(self):
+        return self._n - len(self._deleted) + len(self._added)
+
+    def __iter__(self):
+        for _, rec in self._base_records():
+            url = self._key(rec)
+            if url not in self._deleted: yield url
+        yield from list(self._added)
+
+    def items(self):
+        out = []
+        for _, rec in self._base_records():
+            url = self._key(rec)
+            if url in self._deleted: continue
+            out.append((url, self._changed.get(url) or self._song(url, rec)))
+        return out + list(self._added.items())
+
+    def values(self):
+        return [s for _, s in self.items()]
+
+    def replace(self, songs):
+        self._changed, self._deleted = {}, {self._key(r) for _, r in self._base_records()}
+        self._added = dict(songs)
+        self._rewrite = True
+        self._replaced += 1
+
+    def _ordered(self, hits):
+        """依 dict 順序排序：snapshot 內依檔內順序，新加入的依加入順序排在後面"""
+        added = {url: self._n + i for i, url in enumerate(self._added)} if self._added else {}
+        return [s for _, s, _ in sorted(hits, key=lambda h: added[h[0]] if h[2] is None else h[2])]
+
+    def piano_solo(self):
+        hits = []
+        for slot in self._extras["piano"]:
+            rec = self._rec(slot)
+            url = self._key(rec)
+            if url not in self._deleted and url not in self._changed: hits.append((url, self._song(url, rec), rec[5]))
+        hits += [self._get(url) for url, s in self._changed.items() if s.is_piano_solo]
+        hits += [(url, s, None) for url, s in self._added.items() if s.is_piano_solo]
+        return self._ordered(hits)
+
+    def sanitize(self):
+        bad = []
+        for slot in self._extras["noise"]:
+            rec = self._rec(slot)
+            url = self._key(rec)
+            if url not in self._deleted and url not in self._changed: bad.append(url)
+        bad += [url for url, s in (*self._changed.items(), *self._added.items()) if is_noise(url, s)]
+        for url in bad: del self[url]
+        return len(bad)
+
+    # --- compact ---
+    def _serialize(self, changed, added, deleted):
+        """snapshot 與 index 的 bytes：回傳 (raw, sha, pretty, extras_raw, packed records)"""
+        pretty = wants_pretty(self.path)
+        head, sep, kv, tail = (b"{\n  ", b",\n  ", b": ", b"\n}") if pretty else (b"{", b",", b":", b"}")
+        chunks, records = [], []
+        pos = 0
+
+        def emit(url, value, piano, noise):
+            nonlocal pos
+            key = CODEC.dumps(url)
+            prefix = sep if records else head
+            key_off = pos + len(prefix)
+            val_off = key_off + len(key) + len(kv)
+            chunks.extend((prefix, key, kv, value))
+            pos = val_off + len(value)
+            records.append((parse_song_id(url), len(records), key_off, len(key), val_off, len(value), url, piano, noise))
+
+        def emit_song(url, s):
+            raw = CODEC.dumps(s.to_dict(), pretty)
+            emit(url, raw.replace(b"\n", b"\n  ") if pretty else raw, s.is_piano_solo, is_noise(url, s))
+
+        piano, noise = set(self._extras["piano"]), set(self._extras["noise"])
+        for slot, rec in self._base_records():
+            url = self._key(rec)
+            if url in deleted: continue
+            if url in changed: emit_song(url, changed[url])
+            # 沒變動的 record 直接複製原始 bytes (旗標沿用舊 index)，不必解析再序列化
+            elif self._pretty == pretty: emit(url, self._mm[rec[3]:rec[3] + rec[4]], slot in piano, slot in noise)
+            else: emit_song(url, self._song(url, rec))
+        for url, s in added.items(): emit_song(url, s)
+        raw = b"".join(chunks) + tail if records else b"{}"
+
+        extras, packed = {"piano": [], "noise": [], "noid": {}}, []
+        for slot, (sid, order, key_off, key_len, val_off, val_len, url, is_piano, is_noisy) in enumerate(sorted(records, key=lambda r: (r[0] or 0, r[1]))):
+            if is_piano: extras["piano"].append(slot)
+            if is_noisy: extras["noise"].append(slot)
+            if sid is None: extras["noid"][url] = slot
+            packed.append(self.RECORD.pack(sid or 0, key_off, key_len, val_off, val_len, order))
+        return raw, hashlib.sha1(raw).hexdigest(), pretty, CODEC.dumps(extras), packed
+
+    def _stage_snapshot(self):
+        # 鎖內只複製 overlay (Song 放進 pool 後不會被原地修改)；mmap 在 install() 前不會變，序列化與寫檔都在鎖外
+        changed, added, deleted = dict(self._changed), dict(self._added), set(self._deleted)
+        n, replaced = len(self._changes), self._replaced
+        raw = sha = None
+
+        def write():
+            nonlocal raw, sha
+            raw, sha, pretty, extras_raw, packed = self._serialize(changed, added, deleted)
+            # POSIX 上舊的 mmap 在 replace 後仍指向舊檔，寫檔期間照常可讀；Windows 不能 replace 仍被 mmap 的檔案
+            if os.name == "nt": self._close_maps()
+            atomic_write(self.path, raw)
+            st = os.stat(self.path)
+            header = self.HEADER.pack(self.MAGIC, st.st_size, st.st_mtime_ns, sha.encode(), len(packed), len(extras_raw), pretty)
+            atomic_write(self.index_path, header + extras_raw + b"".join(packed))
+            return install
+
+        def install():
+            """換上新的 mmap；寫檔期間的變動 (_changes[n:]) 重新套用到新 snapshot 上"""
+            later, current = self._changes[n:], self._added
+            self._close_maps()
+            self._changed, self._added, self._deleted = {}, {}, set()
+            ok = self._open_index()
+            if not ok: self._recover(raw, sha)
+            if self._replaced != replaced: self.replace(current)  # 寫檔期間整份換掉：_added 已是完整內容
+            else:
+                for url, s in later: self._apply(url, s)
+            if not ok: raise OSError(f"cannot reopen {self.index_path}")
+            return sha
+
+        if os.name != "nt": return write
+        # Windows：write() 會關掉 mmap，整個在鎖內做完
+        try: write()
+        except:
+            if raw is not None: self._recover(raw, sha)
+            raise
+        install()
+        return lambda: lambda: sha
+
+    def _recover(self, raw, sha):
+        """compact 失敗：舊 snapshot 仍在就沿用 (overlay 不動)；snapshot 已換新但 index 不可用時改為整份放在記憶體"""
+        if self._open_index(): return
+        self._n, self._base = 0, sha
+        self._changed, self._deleted = {}, set()
+        self._added = songs_from_json(CODEC.loads(raw))
+
+
+class JsonStorage:
+    name = "json"
+
+    def __init__(self, pool_files, list_files, lazy_pools=()):
+        self.pool_files, self.list_files, self.lazy_pools = pool_files, list_files, lazy_pools
+        self.pools = []
+
+    def pool(self, name):
+        pool = (LazyJsonPool if name in self.lazy_pools else JsonPool)(self.pool_files[name])
+        self.pools.append(pool)
+        return pool
+
+    def load_list(self, name):
+        return load_txt(self.list_files[name])
+
+    def save_list(self, name, items):
+        return save_txt(self.list_files[name], items)
+
+    def stage_list(self, name, items):
+        return stage_txt(self.list_files[name], items)
+
+    def close(self):
+        for pool in self.pools:
+            if isinstance(pool, LazyJsonPool): pool.close()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    pool TEXT NOT NULL,
+    url TEXT NOT NULL,
+    song_id INTEGER,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    artist_lc TEXT NOT NULL,
+    tags TEXT NOT NULL DEFAULT '[]',
+    is_piano INTEGER NOT NULL DEFAULT 0,
+    is_video INTEGER NOT NULL DEFAULT 0,
+    is_piano_solo INTEGER NOT NULL DEFAULT 0,
+    discovered_at TEXT NOT NULL DEFAULT '',
+    position INTEGER NOT NULL,
+    PRIMARY KEY (pool, url)
+);
+CREATE INDEX IF NOT EXISTS idx_songs_position ON songs (pool, position);
+CREATE INDEX IF NOT EXISTS idx_songs_song_id ON songs (song_id);
+CREATE INDEX IF NOT EXISTS idx_songs_artist ON songs (artist_lc);
+CREATE INDEX IF NOT EXISTS idx_songs_discovered ON songs (pool, discovered_at);
+CREATE INDEX IF NOT EXISTS idx_songs_flags ON songs (pool, is_piano_solo, is_video);
+CREATE TABLE IF NOT EXISTS lists (
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, position)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+SONG_COLUMNS = "url, title, artist, tags, is_piano, is_video, is_piano_solo, discovered_at"
+
+
+def _song(row):
+    url, title, artist, tags, is_piano, is_video, is_piano_solo, discovered_at = row
+    return Song(title, artist, url, json.loads(tags), bool(is_piano), bool(is_video), bool(is_piano_solo), discovered_at)
+
+
+def _values(s, pool):
+    return (pool, s.url, s.song_id, s.title, s.artist, s.artist.lower(), json.dumps(list(s.tags), ensure_ascii=False),
+            int(s.is_piano), int(s.is_video), int(s.is_piano_solo), s.discovered_at)
+
+
+class SqlitePool(MutableMapping):
+    """以 (pool, url) 為主鍵的 songs 表；寫入即 upsert，flush() 才 commit"""
+    UPSERT = f"""
+        INSERT INTO songs (pool, url, song_id, title, artist, artist_lc, tags, is_piano, is_video, is_piano_solo, discovered_at, position)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM songs WHERE pool = ?))
+        ON CONFLICT (pool, url) DO UPDATE SET
+            song_id = excluded.song_id, title = excluded.title, artist = excluded.artist, artist_lc = excluded.artist_lc,
+            tags = excluded.tags, is_piano = excluded.is_piano, is_video = excluded.is_video,
+            is_piano_solo = excluded.is_piano_solo, discovered_at = excluded.discovered_at
+    """
+
+    def __init__(self, db, name):
+        self.db, self.name = db, name
+
+    def _select(self, where="", params=()):
+        rows = self.db.query(f"SELECT {SONG_COLUMNS} FROM songs WHERE pool = ? {where} ORDER BY position", (self.name, *params))
+        return [_song(r) for r in rows]
+
+    def __getitem__(self, url):
+        songs = self._select("AND url = ?", (url,))
+        if not songs: raise KeyError(url)
+        return songs[0]
+
+    def __setitem__(self, url, s):
+        self.db.execute(self.UPSERT, (*_values(s, self.name), self.name))
+
+    def __delitem__(self, url):
+        if not self.db.execute("DELETE FROM songs WHERE pool = ? AND url = ?", (self.name, url)).rowcount: raise KeyError(url)
+
+    def __contains__(self, url):
+        return bool(self.db.query("SELECT 1 FROM songs WHERE pool = ? AND url = ?", (self.name, url)))
+
+    def __iter__(self):
+        return iter([r[0] for r in self.db.query("SELECT url FROM songs WHERE pool = ? ORDER BY position", (self.name,))])
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM songs WHERE pool = ?", (self.name,))[0][0]
+
+    def values(self):
+        return self._select()
+
+    def items(self):
+        return [(s.url, s) for s in self._select()]
+
+    def replace(self, songs):
+        with self.db.lock:
+            self.db.execute("DELETE FROM songs WHERE pool = ?", (self.name,))
+            for s in songs.values(): self[s.url] = s
+
+    def piano_solo(self):
+        return self._select("AND is_piano_solo = 1")
+
+    def sanitize(self):
+        return self.db.execute(
+            "DELETE FROM songs WHERE pool = ? AND (artist = 'Unknown' OR url NOT LIKE '%song.php?data=%')", (self.name,)
+        ).rowcount
+
+    def flush(self):
+        self.db.commit()
+        return True
+
+    def flush_steps(self):
+        return self.flush()  # 與 SqliteStorage.stage_list 相同，commit 留在鎖內
+
+
+class SqliteStorage:
+    name = "sqlite"
+
+    def __init__(self, path, pool_files, list_files):
+        self.path = path
+        self.lock = threading.RLock()
+        # Flask threads / event loop / worker threads 共用同一條連線，所有存取都經過 self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.migrated = None
+        if not self.query("SELECT 1 FROM meta WHERE key = 'migrated_from_json'"):
+            self.migrated = self.migrate(pool_files, list_files)
+        if not self.query("SELECT 1 FROM meta WHERE key = 'canonical_urls'"): self.canonicalize()
+
+    def execute(self, sql, params=()):
+        with self.lock: return self.conn.execute(sql, params)
+
+    def query(self, sql, params=()):
+        with self.lock: return self.conn.execute(sql, params).fetchall()
+
+    def commit(self):
+        with self.lock: self.conn.commit()
+
+    def migrate(self, pool_files, list_files):
+        """一次性搬移 data/*.json 與 *.txt；原檔保留不動，可隨時切回 json engine"""
+        counts = {}
+        with self.lock:
+            for name, path in pool_files.items():
+                pool = self.pool(name)
+                songs = JsonPool(path)
+                for url, s in songs.items(): pool[url] = s
+                counts[name] = len(songs)
+            for name, path in list_files.items():
+                items = load_txt(path)
+                self.save_list(name, items, commit=False)
+                counts[name] = len(items)
+            self.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)", (json.dumps(counts),))
+            self.commit()
+        return counts
+
+    def canonicalize(self):
+        """一次性把舊資料的 url 改成 canonical url；同一 pool 內同一首歌的多筆只留位置最前的一筆"""
+        with self.lock:
+            rows = self.query("SELECT pool, url, song_id FROM songs WHERE song_id IS NOT NULL ORDER BY pool, position")
+            # 先決定每個 (pool, song_id) 留哪一筆並刪掉其餘 (以原本的 url 刪)，最後才改名：
+            # 邊掃邊改名的話，後面那筆 canonical 重複列會把剛改好名的那筆刪掉
+            keep = {}
+            for pool, url, song_id in rows:
+                if (pool, song_id) in keep: self.execute("DELETE FROM songs WHERE pool = ? AND url = ?", (pool, url))
+                else: keep[pool, song_id] = url
+            moved = 0
+            for (pool, song_id), url in keep.items():
+                canon = SONG_URL.format(song_id)
+                if url == canon: continue
+                self.execute("UPDATE songs SET url = ? WHERE pool = ? AND url = ?", (canon, pool, url))
+                moved += 1
+            self.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('canonical_urls', ?)", (str(moved),))
+            self.commit()
+        return moved
+
+    def pool(self, name):
+        return SqlitePool(self, name)
+
+    def load_list(self, name):
+        return [r[0] for r in self.query("SELECT value FROM lists WHERE name = ? ORDER BY position", (name,))]
+
+    def save_list(self, name, items, commit=True):
+        with self.lock:
+            self.execute("DELETE FROM lists WHERE name = ?", (name,))
+            self.conn.executemany("INSERT INTO lists (name, position, value) VALUES (?, ?, ?)", [(name, i, v) for i, v in enumerate(items)])
+            if commit: self.commit()
+        return True
+
+    def stage_list(self, name, items):
+        # 共用同一條連線：鎖外 commit 可能帶到 writer 改到一半的 transaction，直接在鎖內寫完
+        return self.save_list(name, items)
+
+    def close(self):
+        with self.lock: self.conn.close()
+
+
+def open_storage(engine, sqlite_path, pool_files, list_files, lazy_pools=()):
+    if engine == "sqlite": return SqliteStorage(sqlite_path, pool_files, list_files)
+    return JsonStorage(pool_files, list_files, lazy_pools)
+
+
+class WriteBehind:
+    """Debounced write-behind：mark() 只記下 dirty 的 key 與寫入函式，背景 thread 在最後一次變動後
+    delay 秒 (連續變動時最多 max_delay 秒) 一次寫完；同一個 key 在這段期間內的多次變動只寫一次。
+
+    writer 可以分段：在 lock 內執行，回傳 callable 時改在鎖外執行它 (寫檔 / fsync)，它再回傳 callable 時
+    回到鎖內 (換上新狀態)，依此交替；最後回傳 False 表示失敗。鎖內只做序列化，寫檔期間 writer 照常可以修改資料。
+    """
+    def __init__(self, lock, delay=2.0, max_delay=10.0, name="ufret-flusher"):
+        self.lock = lock  # 寫入期間持有 (與修改資料的一方相同)，確保不會寫出改到一半的狀態
+        self.delay, self.max_delay, self.name = delay, max_delay, name
+        self._cond = threading.Condition()
+        self._dirty = {}  # key -> writer()，回傳 False 表示失敗、稍後重試
+        self._first = self._last = 0.0
+        self._thread = None
+        self._stopped = False
+        self._io = threading.Lock()  # 同一時間只有一次 flush (鎖外寫檔時不會有兩份同時寫同一個檔)
+
+    def mark(self, key, writer):
+        with self._cond:
+            now = time.monotonic()
+            if not self._dirty: self._first = now
+            self._dirty[key] = writer
+            self._last = now
+            # Lazy start：import 時不建立 thread (Gunicorn fork 前不要有 thread)
+            if not self._stopped and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond: return list(self._dirty)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._stopped: self._cond.wait()
+                if self._stopped: return
+                wait = min(self._last + self.delay, self._first + self.max_delay) - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+            if not self.flush(): time.sleep(self.delay)  # 磁碟錯誤：不要忙迴圈
+
+    def flush(self, key=None):
+        """立即寫入全部 (或指定 key) 的 dirty 資料；回傳是否全部成功，失敗的會重新排隊
+
+        不可在持有 lock 時呼叫 (背景 flush 先拿到 _io 再等 lock 時會互相卡住)。
+        """
+        with self._io:
+            with self._cond:
+                if key is None: batch, self._dirty = self._dirty, {}
+                else: batch = {key: self._dirty.pop(key)} if key in self._dirty else {}
+            failed = {}
+            for k, writer in batch.items():
+                step, locked = writer, True
+                try:
+                    while callable(step):
+                        if locked:
+                            with self.lock: step = step()
+                        else: step = step()
+                        locked = not locked
+                    ok = step is not False
+                except Exception: ok = False
+                if not ok: failed[k] = writer
+        for k, writer in failed.items(): self.mark(k, writer)
+        return not failed
+
+    def stop(self):
+        """Shutdown：停止背景 thread 並把剩下的 dirty 資料寫完"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread(): thread.join(timeout=5)
+        return self.flush()